@@ -0,0 +1,187 @@
+#
+# http-benchmark.py -- measure web server request rate, one connection per request vs. keep-alive.
+#
+# with no --host, an HttpServer is started in this process (CPython) serving ../src/kpa500-remote/content,
+# and the peak traced heap is reported as a stand-in for heap churn on the Pico-W, along with the number
+# of writes the server made per response.  collections are left to gc_manager, which does not run on CPython,
+# on a device they are in the "gc" section of /api/status.
+# with --host, the requests go to a real device and only the timing is reported.
+# in both cases the client reports how many recv() calls each response took, which is the number of
+# round trips it waited on when the server sends the header and the body in separate segments.
+#
+# usage: http-benchmark.py [--host 192.168.1.73] [--port 80] [--path /api/kpa_status] [--requests 200]
+#
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'kpa500-remote')
+STATUS_PAYLOAD = {'kpa500_data': ['0', '1', '0', '0', '1', '20m', 'AMP ON', '01.54', '160m,80m,60m,40m,30m,20m,17m,15m,12m,10m,6m',
+                                  '000', '000', '000', '31', '752', '0,6,0', '0,10,0', '1234', '0', '4']}
+
+
+def read_response(skt, buffer):
+    """
+    read one response, return (status, body length, connection header value, recv() calls).
+    """
+    data = b''
+    reads = 0
+    while b'\r\n\r\n' not in data:
+        chunk = skt.recv(4096)
+        reads += 1
+        if not chunk:
+            raise ConnectionError('connection closed reading headers')
+        data += chunk
+    head, body = data.split(b'\r\n\r\n', 1)
+    lines = head.split(b'\r\n')
+    status = int(lines[0].split(b' ')[1])
+    content_length = -1
+    connection = b''
+    for line in lines[1:]:
+        name, value = line.split(b':', 1)
+        name = name.strip().lower()
+        if name == b'content-length':
+            content_length = int(value)
+        elif name == b'connection':
+            connection = value.strip().lower()
+    if content_length < 0:
+        while True:
+            chunk = skt.recv(4096)
+            if not chunk:
+                break
+            reads += 1
+            body += chunk
+    else:
+        while len(body) < content_length:
+            chunk = skt.recv(min(len(buffer), content_length - len(body)))
+            reads += 1
+            if not chunk:
+                raise ConnectionError('connection closed reading body')
+            body += chunk
+    return status, len(body), connection, reads
+
+
+def run_close(host, port, path, count):
+    request = f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n'.encode()
+    buffer = bytearray(4096)
+    connections = 0
+    reads = 0
+    t0 = time.perf_counter()
+    for _ in range(count):
+        skt = socket.create_connection((host, port))
+        connections += 1
+        skt.sendall(request)
+        reads += read_response(skt, buffer)[3]
+        skt.close()
+    return time.perf_counter() - t0, connections, reads
+
+
+def run_keep_alive(host, port, path, count):
+    request = f'GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode()
+    buffer = bytearray(4096)
+    connections = 0
+    reads = 0
+    skt = None
+    t0 = time.perf_counter()
+    for _ in range(count):
+        if skt is None:
+            skt = socket.create_connection((host, port))
+            connections += 1
+        skt.sendall(request)
+        _, _, connection, response_reads = read_response(skt, buffer)
+        reads += response_reads
+        if connection != b'keep-alive':
+            skt.close()
+            skt = None
+    if skt is not None:
+        skt.close()
+    return time.perf_counter() - t0, connections, reads
+
+
+BENCHMARKS = (('one connection per request', run_close),
+              ('keep-alive', run_keep_alive))
+
+
+def report(name, elapsed, connections, reads, count, churn=None):
+    line = (f'{name:28s} {count / elapsed:8.1f} req/s  {elapsed * 1000.0 / count:7.2f} ms/req  {connections:4d} connections'
+            f'  {reads / count:5.2f} recv/resp')
+    if churn is not None:
+        line += (f'  {churn[1] / count:5.2f} writes/resp'
+                 f'  {churn[0] / 1024.0:7.1f} KB peak heap')
+    print(line)
+
+
+def start_local_server():
+    sys.path.insert(0, SOURCE_DIR)
+    import micro_logging as logging
+    from http_server import HttpServer, HTTP_STATUS_OK
+    logging.loglevel = logging.ERROR
+
+    class CountingWrites:
+        writes = 0
+
+    def counting_write(self, data, write=asyncio.StreamWriter.write):
+        CountingWrites.writes += 1
+        return write(self, data)
+
+    asyncio.StreamWriter.write = counting_write
+    http_server = HttpServer(content_dir=os.path.join(SOURCE_DIR, 'content') + '/')
+
+    # noinspection PyUnusedLocal
+    @http_server.route(b'/api/kpa_status')
+    async def api_kpa_status_callback(http, verb, args, reader, writer, request_headers=None):
+        bytes_sent = await http.send_simple_response(writer, HTTP_STATUS_OK, http.CT_APP_JSON, STATUS_PAYLOAD)
+        return bytes_sent, HTTP_STATUS_OK
+
+    ready = threading.Event()
+    state = {}
+
+    def serve():
+        loop = asyncio.new_event_loop()
+        server = loop.run_until_complete(asyncio.start_server(http_server.serve_http_client, '127.0.0.1', 0))
+        state['port'] = server.sockets[0].getsockname()[1]
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    ready.wait()
+    return '127.0.0.1', state['port'], CountingWrites
+
+
+def main():
+    parser = argparse.ArgumentParser(description='web server keep-alive benchmark')
+    parser.add_argument('--host', help='device to test, otherwise a local server is started')
+    parser.add_argument('--port', type=int, default=80)
+    parser.add_argument('--path', default='/api/kpa_status')
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    local = args.host is None
+    if local:
+        host, port, counting_writes = start_local_server()
+    else:
+        host, port = args.host, args.port
+    print(f'{args.requests} x GET {args.path} from {host}:{port}')
+
+    for name, benchmark in BENCHMARKS:
+        benchmark(host, port, args.path, 5)  # warm up
+        if local:
+            writes = counting_writes.writes
+            tracemalloc.start()
+            elapsed, connections, reads = benchmark(host, port, args.path, args.requests)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            report(name, elapsed, connections, reads, args.requests,
+                   (peak, counting_writes.writes - writes))
+        else:
+            elapsed, connections, reads = benchmark(host, port, args.path, args.requests)
+            report(name, elapsed, connections, reads, args.requests)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+#
+# listen for KPA500/KAT500 UDP status datagrams and print the changes.
+#
+# usage: udp-status-listener.py [port] [multicast group]
+#
+import socket
+import struct
+import sys
+
+udp_status_port = 4628
+device_status = {}
+last_sequence = {}
+
+
+def parse_status_datagram(data):
+    lines = data.decode().split('\n')
+    header = lines[0].split(' ')
+    if len(header) != 3:
+        print(f'bad header: {lines[0]}')
+        return
+    device_name, kind, sequence = header[0], header[1], int(header[2])
+    previous = last_sequence.get(device_name)
+    if previous is not None and sequence != previous + 1:
+        print(f'{device_name}: lost {sequence - previous - 1} datagram(s), waiting for full snapshot')
+        if kind != 'F':
+            last_sequence[device_name] = sequence
+            return
+    last_sequence[device_name] = sequence
+    status = device_status.setdefault(device_name, {})
+    for line in lines[1:]:
+        if '=' in line:
+            index, value = line.split('=', 1)
+            old_value = status.get(index)
+            if old_value != value:
+                status[index] = value
+                print(f'{device_name} {kind} {sequence}: item {index} set to {value} (was {old_value})')
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else udp_status_port
+    group = sys.argv[2] if len(sys.argv) > 2 else None
+
+    skt = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    skt.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    skt.bind(('', port))
+    if group is not None:
+        membership = struct.pack('4sl', socket.inet_aton(group), socket.INADDR_ANY)
+        skt.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+    print(f'listening on port {port}')
+    try:
+        while True:
+            data, _ = skt.recvfrom(1500)
+            parse_status_datagram(data)
+    except KeyboardInterrupt:
+        skt.close()
+
+
+if __name__ == "__main__":
+    main()
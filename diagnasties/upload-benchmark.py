@@ -0,0 +1,127 @@
+#
+# upload-benchmark.py -- measure file upload throughput through /api/upload_file.
+#
+# with no --host, an HttpServer is started in this process (CPython) with a temporary content directory,
+# and the peak traced heap is reported as a stand-in for heap churn on the Pico-W.
+# with --host, the uploads go to a real device, and the uploaded file is removed afterwards.
+#
+# usage: upload-benchmark.py [--host 192.168.1.73] [--port 80] [--size 65024] [--uploads 20]
+#
+import argparse
+import asyncio
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'kpa500-remote')
+FILENAME = 'benchmark.txt'
+BOUNDARY = b'----uploadbenchmark7d3f0a'
+MAX_UPLOAD_SIZE = 65536  # the server's limit on the whole request body
+
+
+def multipart_body(data):
+    return (b'--' + BOUNDARY + b'\r\n'
+            b'Content-Disposition: form-data; name="file"; filename="' + FILENAME.encode() + b'"\r\n'
+            b'Content-Type: text/plain\r\n\r\n' + data + b'\r\n--' + BOUNDARY + b'--\r\n')
+
+
+def read_response(skt):
+    data = b''
+    while True:
+        chunk = skt.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    return int(data.split(b' ', 2)[1]), data.split(b'\r\n\r\n', 1)[-1]
+
+
+def post(host, port, path, content_type, body):
+    request = (f'POST {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n'
+               f'Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n\r\n').encode() + body
+    skt = socket.create_connection((host, port))
+    skt.sendall(request)
+    result = read_response(skt)
+    skt.close()
+    return result
+
+
+def upload(host, port, body):
+    return post(host, port, '/api/upload_file', f'multipart/form-data; boundary={BOUNDARY.decode()}', body)
+
+
+def start_local_server():
+    sys.path.insert(0, SOURCE_DIR)
+    import micro_logging as logging
+    from http_server import HttpServer
+    logging.loglevel = logging.ERROR
+    content_dir = tempfile.mkdtemp() + '/'
+    http_server = HttpServer(content_dir=content_dir)
+    ready = threading.Event()
+    state = {}
+
+    def serve():
+        loop = asyncio.new_event_loop()
+        server = loop.run_until_complete(asyncio.start_server(http_server.serve_http_client, '127.0.0.1', 0))
+        state['port'] = server.sockets[0].getsockname()[1]
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    ready.wait()
+    return '127.0.0.1', state['port'], content_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description='web server upload benchmark')
+    parser.add_argument('--host', help='device to test, otherwise a local server is started')
+    parser.add_argument('--port', type=int, default=80)
+    parser.add_argument('--size', type=int, default=65024, help='file size in bytes')
+    parser.add_argument('--uploads', type=int, default=20)
+    args = parser.parse_args()
+
+    data = bytes(random.Random(1).choice(b'0123456789abcdef\r\n-') for _ in range(args.size))
+    body = multipart_body(data)
+    if len(body) > MAX_UPLOAD_SIZE:
+        print(f'a {args.size} byte file makes a {len(body)} byte body, the server limit is {MAX_UPLOAD_SIZE}')
+        return
+
+    local = args.host is None
+    if local:
+        host, port, content_dir = start_local_server()
+    else:
+        host, port, content_dir = args.host, args.port, None
+    print(f'{args.uploads} x {args.size} byte upload to {host}:{port}')
+
+    status, response = upload(host, port, body)  # warm up
+    if status != 201:
+        print(f'upload failed: {status} {response}')
+        return
+    if local:
+        with open(content_dir + 'uploaded_' + FILENAME, 'rb') as uploaded:
+            if uploaded.read() != data:
+                print('uploaded file does not match')
+                return
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    for _ in range(args.uploads):
+        upload(host, port, body)
+    elapsed = time.perf_counter() - t0
+    line = (f'{args.uploads * args.size / 1024.0 / elapsed:8.1f} KB/s  '
+            f'{elapsed * 1000.0 / args.uploads:7.2f} ms/upload')
+    if local:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        line += f'  {peak / 1024.0:7.1f} KB peak heap'
+    else:
+        post(host, port, '/api/remove_file', 'application/x-www-form-urlencoded',
+             f'filename=uploaded_{FILENAME}'.encode())
+    print(line)
+
+
+if __name__ == '__main__':
+    main()
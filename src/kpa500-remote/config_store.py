@@ -0,0 +1,184 @@
+#
+# config_store.py -- the configuration, kept in memory and written to flash only when it changes.
+#
+__author__ = 'J. B. Otterson'
+__copyright__ = """
+Copyright 2026 J. B. Otterson N1KDO.
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+  1. Redistributions of source code must retain the above copyright notice,
+     this list of conditions and the following disclaimer.
+  2. Redistributions in binary form must reproduce the above copyright notice,
+     this list of conditions and the following disclaimer in the documentation
+     and/or other materials provided with the distribution.
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
+OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+__version__ = '0.0.5'  # 2026-10-19
+
+# disable pylint import error
+# pylint: disable=E0401
+
+import asyncio
+import json
+import os
+import micro_logging as logging
+
+from http_server import arg_value
+from utils import milliseconds, ticks_diff
+
+DEFAULT_WRITE_DELAY = 2.0  # seconds to wait for more changes before writing the file.
+
+
+class ConfigStore:
+    """
+    the configuration is read from its file once, and every field is checked against its schema entry,
+    a field that is missing or bad gets its default.  changes are made in memory, and the file is
+    rewritten a short while after the last change, so a burst of changes costs one flash write.
+    the new file is written beside the old one and renamed over it, a power cut leaves one or the other.
+    """
+    def __init__(self, filename: str, schema: dict, write_delay: float = DEFAULT_WRITE_DELAY):
+        """
+        schema is field name -> (route argument schema entry, default value).
+        """
+        self.filename = filename
+        self.schema = schema
+        self.write_delay = write_delay
+        self.writes = 0
+        self._values = {}
+        self._saved = None  # the json text that is in the file
+        self._dirty = False
+        self._last_change = 0
+        self._write_task = None
+        self._listeners = []
+        self._loaded = {}  # the values at boot, what a restart-only field is still running with.
+        self.restart_pending = set()  # fields that changed but only take effect after a restart.
+
+    def add_listener(self, listener):
+        """
+        listener(changed) is awaited with the names of the fields each update changes.  it applies what it
+        can while running and returns (restart, rejected): the names it can only apply after a restart,
+        those are added to restart_pending, and the names it tried and failed to apply, those are put
+        back to their old values and reported as bad fields.
+        """
+        self._listeners.append(listener)
+
+    def load(self):
+        stored = {}
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as config_file:
+                text = config_file.read()
+            stored = json.loads(text)
+            self._saved = text
+        except Exception as exc:
+            logging.exception(f'failed to load configuration!', 'config_store:load', exc_info=exc)
+        values = {}
+        for name, (spec, default) in self.schema.items():
+            value = stored.get(name)
+            if value is not None:
+                checked = arg_value(spec, value)
+                if checked is None:
+                    logging.warning(f'bad {name} {value!r} in configuration, using {default!r}', 'config_store:load')
+                value = checked
+            values[name] = default if value is None else value
+        for name, value in stored.items():  # keep fields this version does not know about.
+            if name not in values:
+                values[name] = value
+        self._values = values
+        self._loaded = dict(values)
+        self._dirty = False
+
+    def get(self, name, default=None):
+        return self._values.get(name, default)
+
+    def as_dict(self) -> dict:
+        """
+        return a copy of the configuration.
+        """
+        return dict(self._values)
+
+    async def update(self, changes: dict) -> list:
+        """
+        check every field in changes, then apply them all, or none of them if any is bad.
+        returns the names of the bad fields, and of any field a listener could not apply.
+        """
+        errors = []
+        checked = {}
+        for name, value in changes.items():
+            entry = self.schema.get(name)
+            value = None if entry is None else arg_value(entry[0], value)
+            if value is None:
+                errors.append(name)
+            else:
+                checked[name] = value
+        if errors:
+            return errors
+        changed = []
+        previous = {}
+        for name, value in checked.items():
+            if self._values.get(name) != value:
+                previous[name] = self._values.get(name)
+                self._values[name] = value
+                changed.append(name)
+        if len(changed) == 0:
+            return errors
+        self._dirty = True
+        self._last_change = milliseconds()
+        if self._write_task is None:
+            self._write_task = asyncio.create_task(self._write_later())
+        for listener in self._listeners:
+            try:
+                not_applied, rejected = await listener(changed)
+            except Exception as exc:
+                logging.exception('configuration listener failed', 'config_store:update', exc_info=exc)
+                not_applied, rejected = changed, []
+            for name in rejected:
+                self._values[name] = previous[name]
+                errors.append(name)
+            if not_applied:
+                self.restart_pending.update(name for name in not_applied if name not in rejected)
+        for name in changed:  # set back to what is running, there is nothing to restart for.
+            if self._values.get(name) == self._loaded.get(name):
+                self.restart_pending.discard(name)
+        return errors
+
+    async def _write_later(self):
+        while True:  # every change pushes the write back.
+            wait_ms = int(self.write_delay * 1000) - ticks_diff(milliseconds(), self._last_change)
+            if wait_ms <= 0:
+                break
+            await asyncio.sleep(wait_ms / 1000.0)
+        self._write_task = None
+        self.flush()
+
+    def flush(self) -> bool:
+        """
+        write the configuration now if it differs from the file.  returns True if the file was written.
+        """
+        if not self._dirty:
+            return False
+        self._dirty = False
+        text = json.dumps(self._values)
+        if text == self._saved:  # changed, and then changed back.
+            return False
+        temp_filename = self.filename + '.tmp'
+        try:
+            with open(temp_filename, 'w', encoding='utf-8') as config_file:
+                config_file.write(text)
+            os.rename(temp_filename, self.filename)
+        except OSError as ose:
+            logging.error(f'cannot write configuration: {ose}', 'config_store:flush')
+            self._dirty = True
+            return False
+        self._saved = text
+        self.writes += 1
+        logging.info(f'wrote {self.filename}', 'config_store:flush')
+        return True
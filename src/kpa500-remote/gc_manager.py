@@ -0,0 +1,161 @@
+#
+# gc_manager.py -- decide when to collect garbage, so collections stay off the hot paths.
+#
+__author__ = 'J. B. Otterson'
+__copyright__ = """
+Copyright 2026 J. B. Otterson N1KDO.
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+  1. Redistributions of source code must retain the above copyright notice,
+     this list of conditions and the following disclaimer.
+  2. Redistributions in binary form must reproduce the above copyright notice,
+     this list of conditions and the following disclaimer in the documentation
+     and/or other materials provided with the distribution.
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
+OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+__version__ = '0.0.4'  # 2026-10-19
+
+import asyncio
+import gc
+import time
+import micro_logging as logging
+from utils import milliseconds, ticks_diff, upython
+
+LOW_WATER = 32768  # below this much free heap, collect at the next quiet moment.
+CRITICAL = 12288  # below this much free heap, collect now.
+MIN_ALLOCATED = 4096  # do not collect again until at least this much has been allocated.
+MAX_DEFER_MS = 1000  # the longest a low water collection waits for a quiet moment.
+IDLE_MS = 2000  # after this long with nothing in flight, collect while it is cheap to.
+CHECK_MS = 100  # how often the heap is checked.
+
+
+def _ticks_us() -> int:
+    return time.ticks_us() if upython else int(time.perf_counter() * 1000000)
+
+
+class _BusyMark:
+    """
+    `with` marker for a region that should not be interrupted by a collection.
+    """
+    def __init__(self, manager, polling: bool):
+        self._manager = manager
+        self._polling = polling
+
+    def __enter__(self):
+        self._manager._busy += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._manager._busy -= 1
+        if not self._polling:
+            self._manager._last_busy = milliseconds()
+        return False
+
+
+class GcManager:
+    """
+    one task owns garbage collection.  it checks free heap every CHECK_MS, and collects when it is low,
+    waiting for a moment when no serial exchange or web response is in flight.  code on a hot path
+    marks itself with `with gc_manager.busy():`, serial polling with `with gc_manager.busy(polling=True):`,
+    which never stops, so it does not hold off idle collections.  gc.threshold is set as a backstop, so the allocator
+    only collects by itself if this task cannot keep up.
+    """
+    def __init__(self, low_water=LOW_WATER, critical=CRITICAL, max_defer_ms=MAX_DEFER_MS, idle_ms=IDLE_MS):
+        self.low_water = low_water
+        self.critical = critical
+        self.max_defer_ms = max_defer_ms
+        self.idle_ms = idle_ms
+        self._busy = 0
+        self._last_busy = milliseconds()
+        self._low_since = None
+        self._free_after = 0  # free heap after the last collection
+        self.collections = 0
+        self.reasons = {'critical': 0, 'low water': 0, 'deferred': 0, 'idle': 0}
+        self.last_us = 0
+        self.max_us = 0
+        self.total_us = 0
+        self.last_freed = 0
+        self._marks = (_BusyMark(self, False), _BusyMark(self, True))
+
+    def busy(self, polling: bool = False):
+        return self._marks[1 if polling else 0]
+
+    def collect(self, reason: str):
+        free_before = gc.mem_free()
+        t0 = _ticks_us()
+        gc.collect()
+        elapsed_us = ticks_diff(_ticks_us(), t0)
+        self._free_after = gc.mem_free()
+        self._set_threshold()
+        self._low_since = None
+        self.collections += 1
+        self.reasons[reason] += 1
+        self.last_us = elapsed_us
+        self.total_us += elapsed_us
+        if elapsed_us > self.max_us:
+            self.max_us = elapsed_us
+        self.last_freed = self._free_after - free_before
+        if logging.should_log(logging.DEBUG):
+            logging.debug(f'{reason} collection freed {self.last_freed} bytes in {elapsed_us} us',
+                          'gc_manager:collect')
+
+    def _set_threshold(self):
+        """
+        let the allocator collect by itself only once the heap is below critical, later than this task would.
+        """
+        if upython:
+            gc.threshold(max(self._free_after - self.critical, MIN_ALLOCATED))
+
+    def check(self, now: int):
+        """
+        collect if the heap needs it and this is a good time.
+        """
+        free = gc.mem_free()
+        if self._free_after - free < MIN_ALLOCATED:  # nothing much has been allocated since the last collection.
+            return
+        quiet = self._busy == 0
+        if free < self.critical:
+            self.collect('critical')
+        elif free < self.low_water:
+            if quiet:
+                self.collect('low water')
+            elif self._low_since is None:
+                self._low_since = now
+            elif ticks_diff(now, self._low_since) >= self.max_defer_ms:
+                self.collect('deferred')
+        elif quiet and free < 2 * self.low_water and ticks_diff(now, self._last_busy) >= self.idle_ms:
+            self.collect('idle')
+
+    async def run(self):
+        if not upython:
+            return  # CPython collects for itself.
+        gc.collect()
+        self._free_after = gc.mem_free()
+        self._set_threshold()
+        while True:
+            await asyncio.sleep(CHECK_MS / 1000.0)
+            self.check(milliseconds())
+
+    def stats(self) -> dict:
+        return {
+            'mem_free': gc.mem_free() if upython else -1,
+            'collections': self.collections,
+            'reasons': self.reasons,
+            'last_ms': self.last_us / 1000.0,
+            'max_ms': self.max_us / 1000.0,
+            'mean_ms': self.total_us / self.collections / 1000.0 if self.collections > 0 else 0.0,
+            'last_freed': self.last_freed,
+        }
+
+
+# the one manager, shared by everything that allocates.
+gc_manager = GcManager()
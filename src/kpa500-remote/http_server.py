@@ -23,46 +23,441 @@ LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
 OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
 OF THE POSSIBILITY OF SUCH DAMAGE.
 """
-__version__ = '0.1.16'  # 2026-05-29
+__version__ = '0.1.35'  # 2026-10-19
 
 import asyncio
-import gc
+import binascii
+import hashlib
 import json
 import os
 import re
+import time
 import micro_logging as logging
 
-from utils import milliseconds, safe_int, upython
-if not upython:
+from gc_manager import gc_manager
+from utils import micropython, milliseconds, safe_int, ticks_add, ticks_diff, upython
+from websocket import WebSocket, accept_key
+if upython:
+    from asyncio import TimeoutError
+else:
+    from asyncio.exceptions import TimeoutError
+
     def const(i):
         return i
 
+    def ptr8(buf):  # viper's byte pointer, indexing the buffer directly does the same thing here.
+        return buf
+
 # these are the HTTP responses that will be sent.
 # noinspection PyUnboundLocalVariable
+HTTP_STATUS_SWITCHING_PROTOCOLS = const(101)
 HTTP_STATUS_OK = const(200)
 HTTP_STATUS_CREATED = const(201)
 HTTP_STATUS_MOVED_PERMANENTLY = const(301)
+HTTP_STATUS_NOT_MODIFIED = const(304)
 HTTP_STATUS_BAD_REQUEST = const(400)
+HTTP_STATUS_UNAUTHORIZED = const(401)
 HTTP_STATUS_FORBIDDEN = const(403)
 HTTP_STATUS_CONFLICT = const(409)
 HTTP_STATUS_NOT_FOUND = const(404)
+HTTP_STATUS_METHOD_NOT_ALLOWED = const(405)
+HTTP_STATUS_REQUEST_TIMEOUT = const(408)
 HTTP_STATUS_LENGTH_REQUIRED = const(411)
 HTTP_STATUS_CONTENT_TOO_LARGE = const(413)
+HTTP_STATUS_HEADERS_TOO_LARGE = const(431)
 HTTP_STATUS_INTERNAL_SERVER_ERROR = const(500)
+HTTP_STATUS_SERVICE_UNAVAILABLE = const(503)
+HTTP_STATUS_INSUFFICIENT_STORAGE = const(507)
 
 HTTP_VERB_GET = b'GET'
 HTTP_VERB_POST = b'POST'
 
+# what to do with a new connection when max_connections are already being served.
+QUEUE_REJECT = const(0)  # answer 503 at once.
+QUEUE_WAIT = const(1)  # wait up to queue_timeout for a connection to finish, then answer 503.
+
+# route argument schema entries: (kind, a, b, required)
+ARG_ENUM = const(1)  # a is a tuple of the allowed values
+ARG_INT = const(2)  # a <= int(value) <= b
+ARG_STR = const(3)  # a <= len(value) <= b
+ARG_BOOL = const(4)  # '0' or '1'
+ARG_IPV4 = const(5)  # a dotted quad IPv4 address
+
+
+def arg_enum(values, required=True):
+    return ARG_ENUM, tuple(values), None, required
+
+
+def arg_int(low, high, required=True):
+    return ARG_INT, low, high, required
+
+
+def arg_str(min_length=0, max_length=64, required=True):
+    return ARG_STR, min_length, max_length, required
+
+
+def arg_bool(required=True):
+    return ARG_BOOL, None, None, required
+
+
+def arg_ipv4(required=True):
+    return ARG_IPV4, None, None, required
+
+
+def valid_ipv4(address) -> bool:
+    if not isinstance(address, str):
+        return False
+    octets = address.split('.')
+    if len(octets) != 4:
+        return False
+    for octet in octets:
+        if not 1 <= len(octet) <= 3 or not octet.isdigit() or int(octet) > 255:
+            return False
+    return True
+
+
+def arg_value(spec, value):
+    """
+    return value converted to the type a schema entry describes, or None if it does not fit.
+    """
+    kind, a, b, _ = spec
+    if kind == ARG_ENUM:
+        return value if value in a else None
+    if kind == ARG_INT:
+        number = safe_int(value, None)
+        return number if number is not None and a <= number <= b else None
+    if kind == ARG_STR:
+        return value if isinstance(value, str) and a <= len(value) <= b else None
+    if kind == ARG_BOOL:
+        if value is True or value == '1':
+            return True
+        if value is False or value == '0':
+            return False
+    if kind == ARG_IPV4:
+        return value if valid_ipv4(value) else None
+    return None
+
+
+def validate_args(schema, args):
+    """
+    check args against a route argument schema.  returns None if they are good,
+    else the name of the first bad or missing argument.  arguments not in the schema are ignored.
+    """
+    if schema is None:
+        return None
+    for name, spec in schema.items():
+        value = args.get(name)
+        if value is None:
+            if spec[3]:
+                return name
+            continue
+        if arg_value(spec, value) is None:
+            return name
+    return None
+
+
+def basic_credentials(request_headers):
+    """
+    return (username, password) from a Basic Authorization header, or None if there is not a good one.
+    """
+    if request_headers is None:
+        return None
+    authorization = request_headers.get(b'authorization')
+    if authorization is None or not authorization[:6].lower() == b'basic ':
+        return None
+    try:
+        credentials = binascii.a2b_base64(authorization[6:].strip()).decode()
+    except (ValueError, UnicodeError):
+        return None
+    if ':' not in credentials:
+        return None
+    username, password = credentials.split(':', 1)
+    return username, password
+
+
+class Route:
+    """
+    a registered uri: the callback, the verbs it accepts, and the schema for its arguments.
+    """
+    def __init__(self, callback, verbs, schema, long_lived=False):
+        self.callback = callback
+        self.verbs = verbs
+        self.schema = schema
+        self.long_lived = long_lived  # event streams, WebSockets and long polls have no response deadline.
+        self.allow_header = b'Allow: ' + b', '.join(verbs)
+
+
+class CannedResponse:
+    """
+    a complete fixed response, header and body, built once for each connection disposition.
+    """
+    def __init__(self, http, http_status: int, content_type: bytes, body: bytes):
+        self.http_status = http_status
+        self.body_length = len(body)
+        self.close = http.response_header(http_status, content_type, len(body), False) + body
+        self.keep_alive = http.response_header(http_status, content_type, len(body), True) + body
+
+
 _BUFFER_SIZE = const(4096)
-_MP_START_BOUND = const(1)
-_MP_HEADERS = const(2)
-_MP_DATA = const(3)
-_MP_END_BOUND = const(4)
+_MP_START_BOUND = const(1)  # skipping the preamble, looking for the first boundary
+_MP_HEADERS = const(2)  # reading part header lines
+_MP_DATA = const(3)  # copying part data, looking for the next boundary
+_MP_END_BOUND = const(4)  # reading the rest of the boundary line, '--' ends the body
+_MP_DONE = const(5)
 
 _MAX_UPLOAD_SIZE = const(65536)  # biggest allowed file upload.
+_KEEP_ALIVE_TIMEOUT = 5.0  # seconds an idle persistent connection is kept open.
+_MAX_CONNECTIONS = const(6)  # connections served at once.  each holds a socket, a head buffer and a coroutine.
+_MAX_STREAMS = const(8)  # long lived responses (events, WebSockets, long polls) open at once, apart from the above.
+_QUEUE_TIMEOUT = 6.0  # seconds a connection waits for a free slot with QUEUE_WAIT, longer than a keep-alive idle.
+_HEAD_TIMEOUT = 5.0  # seconds to receive the first request head on a new connection.
+_BODY_TIMEOUT = 5.0  # seconds to wait for each read of a request body.
+_RESPONSE_TIMEOUT = 20.0  # seconds to produce and send a response, except on long lived routes.
+_MAX_KEEP_ALIVE_REQUESTS = const(100)  # requests served on one connection before it is closed.
+_HEAD_BUFFER_SIZE = const(2048)  # the request line and all the headers must fit in this.
+_HEAD_BUFFER_POOL = const(4)  # idle head buffers kept for the next connections.
+
+# the request headers the server and its callbacks use.  the values of all the others are never copied.
+_RECORDED_HEADERS = (b'accept-encoding', b'authorization', b'connection', b'content-length', b'content-type',
+                     b'if-modified-since', b'if-none-match',
+                     b'sec-websocket-key', b'sec-websocket-version', b'transfer-encoding', b'upgrade')
+_RECORDED_HEADERS_BY_LENGTH = {}
+for _name in _RECORDED_HEADERS:
+    _RECORDED_HEADERS_BY_LENGTH[len(_name)] = _RECORDED_HEADERS_BY_LENGTH.get(len(_name), ()) + (_name,)
+
+_CONTENT_CACHE_SIZE = const(49152)  # total bytes of content files kept in memory.
+_CONTENT_CACHE_MAX_FILE = const(30720)  # bigger files are always streamed from flash.
+_COALESCE_SIZE = const(1024)  # bodies up to this size go out in the same write as the header.
 DOTS = '..'
 SEP = '/'
 
+_DAY_NAMES = (b'Mon', b'Tue', b'Wed', b'Thu', b'Fri', b'Sat', b'Sun')
+_MONTH_NAMES = (b'Jan', b'Feb', b'Mar', b'Apr', b'May', b'Jun', b'Jul', b'Aug', b'Sep', b'Oct', b'Nov', b'Dec')
+
+
+def _recorded_header_name(buffer, start: int, end: int):
+    """
+    return the _RECORDED_HEADERS name matching buffer[start:end] without regard to case, or None.
+    """
+    candidates = _RECORDED_HEADERS_BY_LENGTH.get(end - start)
+    if candidates is None:
+        return None
+    for name in candidates:
+        i = 0
+        for j in range(start, end):
+            if buffer[j] | 0x20 != name[i]:
+                break
+            i += 1
+        else:
+            return name
+    return None
+
+
+class _RequestReader:
+    """
+    wraps a connection's stream reader with a fixed buffer for request heads.  the head is read into
+    the buffer and parsed in place; body bytes that arrived with the head are handed out first by
+    read() and readexactly(), so callbacks can use this like the stream it wraps.
+    """
+    def __init__(self, reader, buffer):
+        self._reader = reader
+        self.buffer = buffer
+        self._mv = memoryview(buffer)
+        self._start = 0  # first byte not yet consumed
+        self._end = 0  # end of the bytes in the buffer
+        self._readinto = getattr(reader, 'readinto', None)  # CPython streams do not have readinto
+        self.timeout = None  # seconds each body read may wait, None to wait forever.
+        self.timed_out = False
+
+    async def _read_stream(self, buf) -> int:
+        if self._readinto is not None:
+            count = await self._readinto(buf)
+        else:
+            data = await self._reader.read(len(buf))
+            count = len(data)
+            buf[:count] = data
+        return 0 if count is None else count
+
+    async def _fill(self) -> int:
+        count = await self._read_stream(self._mv[self._end:])
+        self._end += count
+        return count
+
+    async def read_head(self):
+        """
+        read the next request head into the buffer.  returns (start, end) of the head, including the blank line
+        that ends it.  end is 0 if the stream ended before a whole head arrived, -1 if the head does not fit.
+        blank lines before the request line (a stray CRLF after a POST body) are skipped.
+        """
+        buffer = self.buffer
+        pending = self._end - self._start
+        if pending > 0 and self._start > 0:  # a pipelined request, move it to the front.
+            buffer[:pending] = bytes(self._mv[self._start:self._end])
+        self._start = 0
+        self._end = pending
+        head_start = 0
+        line_start = 0
+        scan = 0
+        while True:
+            end = self._end
+            while scan < end:
+                if buffer[scan] == 10:  # LF
+                    if scan == line_start or (scan == line_start + 1 and buffer[line_start] == 13):
+                        if line_start != head_start:
+                            return head_start, scan + 1
+                        head_start = scan + 1
+                    line_start = scan + 1
+                scan += 1
+            if end == len(buffer):
+                return head_start, -1
+            if await self._fill() == 0:
+                return head_start, 0
+
+    def parse_head(self, start: int, end: int):
+        """
+        parse the head in buffer[start:end].  returns (request line, headers) where headers only has
+        the _RECORDED_HEADERS that were sent.  nothing else is copied out of the buffer.
+        """
+        buffer = self.buffer
+        mv = self._mv
+        request_line = None
+        headers = {}
+        line_start = start
+        colon = -1
+        for i in range(start, end):
+            c = buffer[i]
+            if c == 58:  # ':'
+                if colon < 0:
+                    colon = i
+            elif c == 10:  # LF
+                line_end = i
+                if line_end > line_start and buffer[line_end - 1] == 13:
+                    line_end -= 1
+                if request_line is None:
+                    request_line = bytes(mv[line_start:line_end])
+                elif colon > line_start:
+                    name = _recorded_header_name(buffer, line_start, colon)
+                    if name is not None:
+                        value_start = colon + 1
+                        while value_start < line_end and buffer[value_start] in (32, 9):
+                            value_start += 1
+                        value_end = line_end
+                        while value_end > value_start and buffer[value_end - 1] in (32, 9):
+                            value_end -= 1
+                        headers[name] = bytes(mv[value_start:value_end])
+                line_start = i + 1
+                colon = -1
+        self._start = end
+        return request_line, headers
+
+    async def _wait(self, coro):
+        if self.timeout is None:
+            return await coro
+        try:
+            return await asyncio.wait_for(coro, self.timeout)
+        except TimeoutError:
+            self.timed_out = True
+            raise
+
+    async def read(self, n: int = -1) -> bytes:
+        pending = self._end - self._start
+        if pending > 0:
+            if 0 <= n < pending:
+                pending = n
+            data = bytes(self._mv[self._start:self._start + pending])
+            self._start += pending
+            return data
+        return await self._wait(self._reader.read(n))
+
+    async def readinto(self, buf) -> int:
+        """
+        read into a buffer or memoryview without allocating.  returns the count, 0 at the end of the stream.
+        """
+        pending = self._end - self._start
+        if pending > 0:
+            if pending > len(buf):
+                pending = len(buf)
+            buf[:pending] = self._mv[self._start:self._start + pending]
+            self._start += pending
+            return pending
+        return await self._wait(self._read_stream(buf))
+
+    async def readexactly(self, n: int) -> bytes:
+        if self._end - self._start > 0:
+            data = await self.read(n)
+            if len(data) < n:
+                data += await self._wait(self._reader.readexactly(n - len(data)))
+            return data
+        return await self._wait(self._reader.readexactly(n))
+
+
+def http_date(seconds: int) -> bytes:
+    t = time.gmtime(seconds)
+    return b'%s, %02d %s %04d %02d:%02d:%02d GMT' % (_DAY_NAMES[t[6]], t[2], _MONTH_NAMES[t[1] - 1], t[0], t[3], t[4], t[5])
+
+
+class _Validators:
+    """
+    the cache validators for one version of a content file, and the headers that carry them.
+    """
+    def __init__(self, etag: bytes, last_modified, cache_control, gzipped: bool = False):
+        self.etag = etag
+        self.last_modified = last_modified
+        # the same url can be sent gzipped or not, so shared caches must key on Accept-Encoding.
+        self.headers = [b'ETag: ' + etag, b'Vary: Accept-Encoding']
+        if last_modified is not None:
+            self.headers.append(b'Last-Modified: ' + last_modified)
+        if cache_control is not None:
+            self.headers.append(b'Cache-Control: ' + cache_control)
+        if gzipped:
+            self.content_headers = self.headers + [b'Content-Encoding: gzip']
+        else:
+            self.content_headers = self.headers
+
+    def not_modified(self, request_headers) -> bool:
+        """
+        does a conditional request match this version?  If-None-Match wins over If-Modified-Since.
+        """
+        if request_headers is None:
+            return False
+        if_none_match = request_headers.get(b'if-none-match')
+        if if_none_match is not None:
+            for tag in if_none_match.split(b','):
+                tag = tag.strip()
+                if tag.startswith(b'W/'):
+                    tag = tag[2:]
+                if tag == self.etag or tag == b'*':
+                    return True
+            return False
+        # browsers send back the Last-Modified value verbatim, so an exact match is enough.
+        return self.last_modified is not None and request_headers.get(b'if-modified-since') == self.last_modified
+
+
+class _CachedContent:
+    """
+    a content file held in memory, with its response headers already built.
+    """
+    def __init__(self, close_header: bytes, keep_alive_header: bytes, body: bytes, validators: _Validators):
+        self.close_header = close_header
+        self.keep_alive_header = keep_alive_header
+        self.body = body
+        self.validators = validators
+        self.last_used = 0
+
+
+def _accepts_gzip(request_headers) -> bool:
+    if request_headers is None:
+        return False
+    accept_encoding = request_headers.get(b'accept-encoding')
+    if accept_encoding is None:
+        return False
+    for coding in accept_encoding.split(b','):
+        pieces = coding.split(b';')
+        if pieces[0].strip().lower() == b'gzip':
+            return len(pieces) < 2 or pieces[1].strip() not in (b'q=0', b'q=0.0', b'q=0.00', b'q=0.000')
+    return False
+
+
 def _safe_content_path(content_dir: str, filename: str) -> str:
     """
     Return a 'safe' content path for a relative filename,
@@ -77,15 +472,98 @@ def _safe_content_path(content_dir: str, filename: str) -> str:
     return joined
 
 
+def _kmp_table(pattern: bytes) -> bytearray:
+    """
+    the Knuth-Morris-Pratt failure table: table[i] is the length of the longest proper prefix
+    of pattern[:i + 1] that is also a suffix of it.  patterns are multipart delimiters, at most 74 bytes.
+    """
+    table = bytearray(len(pattern))
+    k = 0
+    for i in range(1, len(pattern)):
+        while k > 0 and pattern[i] != pattern[k]:
+            k = table[k - 1]
+        if pattern[i] == pattern[k]:
+            k += 1
+        table[i] = k
+    return table
+
+
+@micropython.viper
+def _match_boundary(buffer, start: int, end: int, pattern, table, matched: int) -> int:
+    """
+    feed buffer[start:end] to the KMP matcher for pattern, with matched bytes of pattern already matched.
+    returns how many bytes of pattern are matched at end, or -1 - i when a whole match ends just before i.
+    """
+    buf = ptr8(buffer)
+    pat = ptr8(pattern)
+    tab = ptr8(table)
+    length = int(len(pattern))
+    i = start
+    while i < end:
+        c = buf[i]
+        while matched > 0 and c != pat[matched]:
+            matched = tab[matched - 1]
+        if c == pat[matched]:
+            matched += 1
+            if matched == length:
+                return -2 - i
+        i += 1
+    return matched
+
+
+_BYTEARRAY_FIND = hasattr(bytearray, 'find')  # not every MicroPython build has bytearray.find()
+
+
+def _find_boundary(buffer, start: int, end: int, pattern, table, matched: int) -> int:
+    """
+    _match_boundary, with the search done by bytearray.find() where there is one, it is C code and allocates nothing.
+    the KMP matcher only finishes a partial match carried over from the last read, and finds the partial match
+    at the end of this one.
+    """
+    if not _BYTEARRAY_FIND:
+        return _match_boundary(buffer, start, end, pattern, table, matched)
+    i = start
+    while matched > 0 and i < end:
+        matched = _match_boundary(buffer, i, i + 1, pattern, table, matched)
+        if matched < 0:
+            return matched
+        i += 1
+    if i == end:
+        return matched
+    length = len(pattern)
+    index = buffer.find(pattern, i, end)
+    if index >= 0:
+        return -1 - index - length
+    tail = end - length + 1
+    if tail < i:
+        tail = i
+    return _match_boundary(buffer, tail, end, pattern, table, 0)
+
+
+@micropython.viper
+def _find_crlf(buffer, start: int, end: int) -> int:
+    buf = ptr8(buffer)
+    i = start
+    end -= 1
+    while i < end:
+        if buf[i] == 13 and buf[i + 1] == 10:
+            return i
+        i += 1
+    return -1
+
+
 class HttpServer:
     CT_TEXT_TEXT = b'text/plain'
     CT_TEXT_HTML = b'text/html'
     CT_APP_JSON = b'application/json'
     CT_APP_WWW_FORM = b'application/x-www-form-urlencoded'
     CT_MULTIPART_FORM = b'multipart/form-data'
+    CT_APP_TAR = b'application/x-tar'
+    CT_TEXT_EVENT_STREAM = b'text/event-stream'
 
     FILE_EXTENSION_TO_CONTENT_TYPE_MAP = {
         'gif': b'image/gif',
+        'gz': b'application/gzip',
         'html': CT_TEXT_HTML,
         'ico': b'image/vnd.microsoft.icon',
         'json': CT_APP_JSON,
@@ -97,22 +575,38 @@ class HttpServer:
     }
     HYPHENS = b'--'
     HTTP_STATUS_TEXT = {
+        HTTP_STATUS_SWITCHING_PROTOCOLS: b'Switching Protocols',
         HTTP_STATUS_OK: b'OK',
         HTTP_STATUS_CREATED: b'Created',
         #202: b'Accepted',
         #204: b'No Content',
         HTTP_STATUS_MOVED_PERMANENTLY: b'Moved Permanently',
         #302: b'Moved Temporarily',
-        #304: b'Not Modified',
+        HTTP_STATUS_NOT_MODIFIED: b'Not Modified',
         HTTP_STATUS_BAD_REQUEST: b'Bad Request',
-        #401: b'Unauthorized',
+        HTTP_STATUS_UNAUTHORIZED: b'Unauthorized',
         HTTP_STATUS_FORBIDDEN: b'Forbidden',
         HTTP_STATUS_NOT_FOUND: b'Not Found',
+        HTTP_STATUS_METHOD_NOT_ALLOWED: b'Method Not Allowed',
+        HTTP_STATUS_LENGTH_REQUIRED: b'Length Required',
+        HTTP_STATUS_CONTENT_TOO_LARGE: b'Content Too Large',
+        HTTP_STATUS_REQUEST_TIMEOUT: b'Request Timeout',
         HTTP_STATUS_CONFLICT: b'Conflict',
+        HTTP_STATUS_HEADERS_TOO_LARGE: b'Request Header Fields Too Large',
         HTTP_STATUS_INTERNAL_SERVER_ERROR: b'Internal Server Error',
         #501: b'Not Implemented',
         #502: b'Bad Gateway',
-        #503: b'Service Unavailable',
+        HTTP_STATUS_SERVICE_UNAVAILABLE: b'Service Unavailable',
+        HTTP_STATUS_INSUFFICIENT_STORAGE: b'Insufficient Storage',
+    }
+
+    # Cache-Control for content files, by extension.  pages are revalidated every time, which is cheap with ETags.
+    CACHE_CONTROL = {
+        'css': b'no-cache',
+        'html': b'no-cache',
+        'ico': b'max-age=86400',
+        'js': b'no-cache',
+        '*': b'no-cache',
     }
 
     DANGER_ZONE_FILE_NAMES = (
@@ -121,48 +615,233 @@ class HttpServer:
         'setup.html',
     )
 
-    def __init__(self, content_dir):
+    def __init__(self, content_dir, keep_alive_timeout=_KEEP_ALIVE_TIMEOUT, max_keep_alive_requests=_MAX_KEEP_ALIVE_REQUESTS,
+                 content_cache_size=_CONTENT_CACHE_SIZE, content_cache_max_file=_CONTENT_CACHE_MAX_FILE,
+                 cache_control=None, max_connections=_MAX_CONNECTIONS, queue_policy=QUEUE_WAIT,
+                 queue_timeout=_QUEUE_TIMEOUT, head_timeout=_HEAD_TIMEOUT, body_timeout=_BODY_TIMEOUT,
+                 response_timeout=_RESPONSE_TIMEOUT, max_streams=_MAX_STREAMS):
         self.content_dir = content_dir
-        self.uri_map = {b'/api/get_files': api_get_files_callback,
-                        b'/api/upload_file': api_upload_file_callback,
-                        b'/api/remove_file': api_remove_file_callback,
-                        b'/api/rename_file': api_rename_file_callback,
+        self.cache_control = cache_control if cache_control is not None else self.CACHE_CONTROL
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_keep_alive_requests = max_keep_alive_requests
+        self._keep_alive = {}  # writer -> can this connection serve another request after this response?
+        self._head_buffers = []  # idle request head buffers
+        self.max_connections = max_connections
+        self.max_streams = max_streams
+        self.queue_policy = queue_policy
+        self.queue_timeout = queue_timeout
+        self.head_timeout = head_timeout
+        self.body_timeout = body_timeout
+        self.response_timeout = response_timeout
+        self._connection_released = asyncio.Event()
+        self.connections_active = 0
+        self.connections_peak = 0
+        self.connections_queued = 0
+        self.connections_rejected = 0
+        self._unslotted = set()  # writers of open connections that do not hold a connection slot right now
+        self.streams_active = 0
+        self.streams_peak = 0
+        self.streams_rejected = 0
+        self.head_timeouts = 0
+        self.body_timeouts = 0
+        self.response_timeouts = 0
+        self._header_blocks = {}  # http status -> content type -> canned start of the response header
+        self.uri_map = {b'/api/get_files': Route(api_get_files_callback, (HTTP_VERB_GET,), None),
+                        b'/api/upload_file': Route(api_upload_file_callback, (HTTP_VERB_POST,), None),
+                        b'/api/remove_file': Route(api_remove_file_callback, (HTTP_VERB_POST,),
+                                                   {'filename': arg_str(1, 64)}),
+                        b'/api/rename_file': Route(api_rename_file_callback, (HTTP_VERB_POST,),
+                                                   {'filename': arg_str(1, 64), 'newname': arg_str(1, 64)}),
                         }
 
         self.buffer = bytearray(_BUFFER_SIZE)
         self.bmv = memoryview(self.buffer)
-        self._content_lock = asyncio.Lock()
+        self.buffer_lock = asyncio.Lock()  # protects self.buffer, used to stream big files and receive uploads.
+        self._content_cache = {}  # file path -> _CachedContent
+        self._content_cache_bytes = 0
+        self._content_cache_clock = 0
+        self.content_cache_size = content_cache_size
+        self.content_cache_max_file = content_cache_max_file
+        self.content_cache_hits = 0
+        self.content_cache_misses = 0
+        self._file_hashes = {}  # file path -> (size, mtime, sha1 hex digest)
+        self._gzip_siblings = {}  # file path -> does file path + '.gz' exist?
 
-    def route(self, uri):
+    def route(self, uri, verbs=(HTTP_VERB_GET, HTTP_VERB_POST), args=None, long_lived=False):
+        """
+        register a callback for uri.  requests with other verbs get 405, and requests whose
+        arguments do not match the args schema get 400, without the callback being called.
+        long_lived callbacks hold the connection open on purpose, so they get no response or read deadline.
+        """
         if isinstance(uri, str):
             logging.warning(f'uri {uri} is str not bytes', 'http_server:add_uri_callback')
             uri = uri.encode('utf-8')
 
         def decorator(func):
-            self.uri_map[uri] = func
+            self.uri_map[uri] = Route(func, verbs, args, long_lived)
             return func
         return decorator
 
-    async def serve_content(self, writer, filename):
+    def canned_response(self, http_status: int, content_type: bytes, body: bytes) -> CannedResponse:
+        return CannedResponse(self, http_status, content_type, body)
+
+    async def send_canned_response(self, writer, canned: CannedResponse):
+        writer.write(canned.keep_alive if self._keep_alive.get(writer) else canned.close)
+        await writer.drain()
+        return canned.body_length, canned.http_status
+
+    def invalidate_content(self, filename=None):
+        """
+        forget the cached copy of a content file path, or every cached file if filename is None.
+        called whenever a content file is written, renamed, or removed.
+        """
+        if filename is None:
+            self._content_cache.clear()
+            self._content_cache_bytes = 0
+            self._file_hashes.clear()
+            self._gzip_siblings.clear()
+        else:
+            entry = self._content_cache.pop(filename, None)
+            if entry is not None:
+                self._content_cache_bytes -= len(entry.body)
+            self._file_hashes.pop(filename, None)
+            self._gzip_siblings.pop(filename, None)
+            if filename.endswith('.gz'):
+                self._gzip_siblings.pop(filename[:-3], None)
+
+    def file_hash(self, filename: str, size: int, mtime: int, data=None) -> str:
+        """
+        return the sha1 hex digest of a file, computed once per (size, mtime) version and then cached.
+        data is the file contents, if the caller already has them.
+        """
+        cached = self._file_hashes.get(filename)
+        if cached is not None and cached[0] == size and cached[1] == mtime:
+            return cached[2]
+        sha1 = hashlib.sha1()
+        if data is not None:
+            sha1.update(data)
+        else:
+            chunk = bytearray(512)  # self.buffer may be in use by a streaming response.
+            mv = memoryview(chunk)
+            with open(filename, 'rb') as infile:
+                while True:
+                    bytes_read = infile.readinto(chunk)
+                    if not bytes_read:
+                        break
+                    sha1.update(mv[:bytes_read])
+        digest = binascii.hexlify(sha1.digest()).decode()
+        self._file_hashes[filename] = (size, mtime, digest)
+        return digest
+
+    def _validators(self, filename: str, extension: str, size: int, mtime: int, data=None,
+                    gzipped: bool = False) -> _Validators:
+        etag = b'"%x-%s"' % (size, self.file_hash(filename, size, mtime, data)[:16].encode())
+        cache_control = self.cache_control.get(extension, self.cache_control.get('*'))
+        return _Validators(etag, http_date(mtime) if mtime > 0 else None, cache_control, gzipped)
+
+    def _has_gzip_sibling(self, filename: str) -> bool:
+        if filename.endswith('.gz'):
+            return False
+        has_sibling = self._gzip_siblings.get(filename)
+        if has_sibling is None:
+            has_sibling = file_size(filename + '.gz') >= 0
+            self._gzip_siblings[filename] = has_sibling
+        return has_sibling
+
+    async def _send_not_modified(self, writer, validators: _Validators):
+        # a 304 never has a body, so the connection can be kept open without a Content-length.
+        writer.write(self.response_header(HTTP_STATUS_NOT_MODIFIED, None, -1, self._keep_alive.get(writer, False),
+                                          validators.headers))
+        await writer.drain()
+        return 0, HTTP_STATUS_NOT_MODIFIED
+
+    def _cache_content(self, filename, extension, content_type, content_length, mtime, gzipped):
+        """
+        read a small content file into the cache, evicting the least recently used files to make room.
+        """
+        with open(filename, 'rb') as infile:
+            body = infile.read()
+        if len(body) != content_length:  # changed underneath us, do not cache it.
+            return None
+        validators = self._validators(filename, extension, content_length, mtime, body, gzipped)
+        cache = self._content_cache
+        while len(cache) > 0 and self._content_cache_bytes + content_length > self.content_cache_size:
+            oldest = None
+            for name, entry in cache.items():
+                if oldest is None or entry.last_used < cache[oldest].last_used:
+                    oldest = name
+            # only the body is evicted, the file hash is still good for the inventory and etags.
+            self._content_cache_bytes -= len(cache.pop(oldest).body)
+        headers = validators.content_headers
+        entry = _CachedContent(self.response_header(HTTP_STATUS_OK, content_type, content_length, False, headers),
+                               self.response_header(HTTP_STATUS_OK, content_type, content_length, True, headers),
+                               body, validators)
+        cache[filename] = entry
+        self._content_cache_bytes += content_length
+        return entry
+
+    async def serve_content(self, writer, filename, request_headers=None):
         try:
             filename = _safe_content_path(self.content_dir, filename)
         except ValueError:
             response = b'<html><body><p>403 -- Forbidden.</p></body></html>'
             return (await self.send_simple_response(writer, HTTP_STATUS_FORBIDDEN, self.CT_TEXT_HTML, response),
                     HTTP_STATUS_FORBIDDEN)
-        try:
-            content_length = file_size(filename)
-        except OSError:
-            content_length = -1
-        if content_length < 0:
-            response = b'<html><body><p>404 -- File not found.</p></body></html>'
-            return (await self.send_simple_response(writer, HTTP_STATUS_NOT_FOUND, self.CT_TEXT_HTML, response),
-                    HTTP_STATUS_NOT_FOUND)
         extension = filename.split('.')[-1].lower()
         content_type = self.FILE_EXTENSION_TO_CONTENT_TYPE_MAP.get(extension, b'application/octet-stream')
-        await self.start_response(writer, HTTP_STATUS_OK, content_type, content_length)
+        # serve the precompressed name.gz copy made by the loader when the client can take it.
+        if _accepts_gzip(request_headers) and self._has_gzip_sibling(filename):
+            result = await self._serve_file(writer, filename + '.gz', extension, content_type, request_headers, True)
+            if result is not None:
+                return result
+        result = await self._serve_file(writer, filename, extension, content_type, request_headers, False)
+        if result is None:
+            response = b'<html><body><p>404 -- File not found.</p></body></html>'
+            result = (await self.send_simple_response(writer, HTTP_STATUS_NOT_FOUND, self.CT_TEXT_HTML, response),
+                      HTTP_STATUS_NOT_FOUND)
+        return result
+
+    async def _serve_file(self, writer, filename, extension, content_type, request_headers, gzipped):
+        """
+        send one content file, from the cache if possible.  returns (bytes_sent, http_status), or None if not found.
+        """
+        entry = self._content_cache.get(filename)
+        if entry is None:
+            self.content_cache_misses += 1
+            content_length, mtime = file_size_mtime(filename)
+            if content_length < 0:
+                return None
+            if content_length <= self.content_cache_max_file and content_length <= self.content_cache_size:
+                try:
+                    entry = self._cache_content(filename, extension, content_type, content_length, mtime, gzipped)
+                except OSError as ose:
+                    logging.warning(f'cannot cache {filename}: {ose}', 'http_server:serve_content')
+            if entry is None:
+                try:
+                    validators = self._validators(filename, extension, content_length, mtime, None, gzipped)
+                except OSError as ose:
+                    logging.warning(f'cannot hash {filename}: {ose}', 'http_server:serve_content')
+                    return None
+                if validators.not_modified(request_headers):
+                    return await self._send_not_modified(writer, validators)
+                return await self._stream_content(writer, filename, content_type, content_length, validators)
+        else:
+            self.content_cache_hits += 1
+        self._content_cache_clock += 1
+        entry.last_used = self._content_cache_clock
+        if entry.validators.not_modified(request_headers):
+            return await self._send_not_modified(writer, entry.validators)
+        # no await between the header and body writes, so the entry cannot be swapped out in between.
+        self._write_response(writer, entry.keep_alive_header if self._keep_alive.get(writer) else entry.close_header,
+                             entry.body)
+        await writer.drain()
+        return len(entry.body), HTTP_STATUS_OK
+
+    async def _stream_content(self, writer, filename, content_type, content_length, validators=None):
+        await self.start_response(writer, HTTP_STATUS_OK, content_type, content_length,
+                                  validators.content_headers if validators is not None else None)
         try:
-            async with self._content_lock:
+            async with self.buffer_lock:
                 with open(filename, 'rb', buffering=_BUFFER_SIZE) as infile:
                     bytes_since_drain = 0
                     # Drain after roughly 16 KB or at EOF to reduce syscall overhead while preventing buffer bloat.
@@ -184,21 +863,59 @@ class HttpServer:
             logging.exception(f'error serving {filename}', 'http_server:serve_content', exc_info=exc)
         return content_length, HTTP_STATUS_OK
 
-    async def start_response(self, writer, http_status:int=HTTP_STATUS_OK, content_type:bytes=b'', response_size:int=0, extra_headers:list[bytes]=None):
-        status_text = self.HTTP_STATUS_TEXT.get(http_status) or b'Confused'
-        writer.write(b'HTTP/1.0 %d %s\r\n' % (http_status, status_text))
-        writer.write(b'Access-Control-Allow-Origin: *\r\n')  # CORS override
-        if content_type is not None and len(content_type) > 0:
-            writer.write(b'Content-type: ')
-            writer.write(content_type)
-            writer.write(b'; charset=UTF-8\r\n')
+    def _header_block(self, http_status: int, content_type: bytes) -> bytes:
+        """
+        the status line, CORS and content type headers, built once for each status and content type pair.
+        """
+        if content_type is None:
+            content_type = b''
+        blocks = self._header_blocks.get(http_status)
+        if blocks is None:
+            blocks = {}
+            self._header_blocks[http_status] = blocks
+        block = blocks.get(content_type)
+        if block is None:
+            status_text = self.HTTP_STATUS_TEXT.get(http_status) or b'Confused'
+            block = b'HTTP/1.1 %d %s\r\nAccess-Control-Allow-Origin: *\r\n' % (http_status, status_text)  # CORS override
+            if len(content_type) > 0:
+                block += b'Content-type: %s; charset=UTF-8\r\n' % content_type
+            blocks[content_type] = block
+        return block
+
+    def response_header(self, http_status:int, content_type:bytes, response_size:int, keep_alive:bool, extra_headers:list[bytes]=None) -> bytes:
+        block = self._header_block(http_status, content_type)
+        connection = b'Connection: keep-alive\r\n' if keep_alive else b'Connection: close\r\n'
+        if extra_headers is None:
+            if response_size >= 0:
+                return b'%sContent-length: %d\r\n%s\r\n' % (block, response_size, connection)
+            return b'%s%s\r\n' % (block, connection)
+        parts = [block]
         if response_size >= 0:
-            writer.write(b'Content-length: %d\r\n' % response_size)
-        if extra_headers is not None:
-            for header in extra_headers:
-                writer.write(header)
-                writer.write(b'\r\n')
-        writer.write(b'\r\n')
+            parts.append(b'Content-length: %d\r\n' % response_size)
+        parts.append(connection)
+        for header in extra_headers:
+            parts.append(header)
+            parts.append(b'\r\n')
+        parts.append(b'\r\n')
+        return b''.join(parts)
+
+    @staticmethod
+    def _write_response(writer, header: bytes, body: bytes):
+        """
+        write a response header and its body.  small bodies are joined to the header, so the whole
+        response leaves in one segment instead of a header segment that waits on the client's delayed ACK.
+        """
+        if len(body) <= _COALESCE_SIZE:
+            writer.write(header + body)
+        else:
+            writer.write(header)
+            writer.write(body)
+
+    async def start_response(self, writer, http_status:int=HTTP_STATUS_OK, content_type:bytes=b'', response_size:int=0, extra_headers:list[bytes]=None):
+        if response_size < 0:
+            self._keep_alive[writer] = False  # without a length, closing the connection ends the response.
+        writer.write(self.response_header(http_status, content_type, response_size,
+                                          self._keep_alive.get(writer, False), extra_headers))
         await writer.drain()
 
     async def send_simple_response(self, writer, http_status=HTTP_STATUS_OK, content_type=b'', response=None, extra_headers=None):
@@ -206,23 +923,47 @@ class HttpServer:
         typ = type(response)
         if response is None:
             await self.start_response(writer, http_status, content_type, 0, extra_headers)
-        elif typ == bytes:
-            content_length = len(response)
-            await self.start_response(writer, http_status, content_type, content_length, extra_headers)
-            if response is not None and len(response) > 0:
-                writer.write(response)
-        elif typ in [dict, list]:
-            response = json.dumps(response).encode('utf-8')
+        elif typ in [bytes, dict, list]:
+            if typ != bytes:
+                response = json.dumps(response).encode('utf-8')
+                content_type = HttpServer.CT_APP_JSON
             content_length = len(response)
-            content_type = HttpServer.CT_APP_JSON
-            await self.start_response(writer, http_status, content_type, content_length, extra_headers)
-            if content_length > 0:
-                writer.write(response)
+            self._write_response(writer, self.response_header(http_status, content_type, content_length,
+                                                              self._keep_alive.get(writer, False), extra_headers),
+                                 response)
         else:
             logging.error(f'trying to serialize {typ} response.', 'http_server:send_simple_response')
+            self._keep_alive[writer] = False
         await writer.drain()
         return content_length
 
+    @staticmethod
+    def write_event(writer, event: bytes, data: bytes) -> int:
+        """
+        write one Server-Sent Event.  data must not contain newlines.
+        """
+        message = b'event: %s\ndata: %s\n\n' % (event, data)
+        writer.write(message)
+        return len(message)
+
+    async def accept_websocket(self, reader, writer, request_headers):
+        """
+        complete a WebSocket upgrade handshake.  returns a WebSocket, or None if the request is not
+        a valid upgrade, in which case nothing has been written.  the connection is not reused for HTTP.
+        """
+        if request_headers is None or request_headers.get(b'upgrade', b'').lower() != b'websocket':
+            return None
+        key = request_headers.get(b'sec-websocket-key')
+        if key is None or request_headers.get(b'sec-websocket-version') != b'13':
+            return None
+        self._keep_alive[writer] = False
+        writer.write(b'HTTP/1.1 101 Switching Protocols\r\n'
+                     b'Upgrade: websocket\r\n'
+                     b'Connection: Upgrade\r\n'
+                     b'Sec-WebSocket-Accept: %s\r\n\r\n' % accept_key(key))
+        await writer.drain()
+        return WebSocket(reader, writer)
+
     @classmethod
     def url_unquote(cls, s):
         s = s.replace('+', ' ')
@@ -250,19 +991,217 @@ class HttpServer:
                 args[cls.url_unquote(arg_parts[0])] = cls.url_unquote(arg_parts[1])
         return args
 
+    async def _acquire_connection(self) -> bool:
+        """
+        take one of the max_connections slots.  returns False if the connection should be turned away.
+        """
+        if self.connections_active >= self.max_connections:
+            if self.queue_policy != QUEUE_WAIT:
+                return False
+            self.connections_queued += 1
+            deadline = ticks_add(milliseconds(), int(self.queue_timeout * 1000))
+            while self.connections_active >= self.max_connections:
+                remaining = ticks_diff(deadline, milliseconds())
+                if remaining <= 0:
+                    return False
+                self._connection_released.clear()
+                try:
+                    await asyncio.wait_for(self._connection_released.wait(), remaining / 1000.0)
+                except TimeoutError:
+                    return False
+        self.connections_active += 1
+        if self.connections_active > self.connections_peak:
+            self.connections_peak = self.connections_active
+        return True
+
+    def _release_connection(self):
+        self.connections_active -= 1
+        self._connection_released.set()
+
+    def _drop_slot(self, writer):
+        """
+        give back a connection's slot while it only waits on its client: between requests on a kept alive
+        connection, and for the life of a stream, so those cannot lock out page loads.
+        """
+        if writer not in self._unslotted:
+            self._unslotted.add(writer)
+            self._release_connection()
+
+    async def _regain_slot(self, writer, wait=True) -> bool:
+        """
+        take a slot again for a connection that gave its slot back.  returns False if there is none.
+        """
+        if writer not in self._unslotted:
+            return True
+        if not wait and self.connections_active >= self.max_connections:
+            return False
+        if not await self._acquire_connection():
+            return False
+        self._unslotted.discard(writer)
+        return True
+
+    def stats(self) -> dict:
+        return {'connections': self.connections_active,
+                'peak_connections': self.connections_peak,
+                'queued': self.connections_queued,
+                'rejected': self.connections_rejected,
+                'streams': self.streams_active,
+                'peak_streams': self.streams_peak,
+                'streams_rejected': self.streams_rejected,
+                'head_timeouts': self.head_timeouts,
+                'body_timeouts': self.body_timeouts,
+                'response_timeouts': self.response_timeouts,
+                'content_cache_hits': self.content_cache_hits,
+                'content_cache_misses': self.content_cache_misses,
+                }
+
     async def serve_http_client(self, reader, writer):
-        gc.collect()
-        # micropython.mem_info()
-        t0 = milliseconds()
-        http_status = HTTP_STATUS_INTERNAL_SERVER_ERROR
-        bytes_sent = 0
+        """
+        serve one connection.  HTTP/1.1 connections (and HTTP/1.0 connections that ask for it) are
+        kept open for more requests until the client closes, the connection is idle for
+        keep_alive_timeout seconds, or max_keep_alive_requests requests have been served.
+        at most max_connections are served at once, the rest wait or are rejected by queue_policy.
+        """
         partner = writer.get_extra_info('peername')[0]
+        if not await self._acquire_connection():
+            self.connections_rejected += 1
+            logging.warning(f'too many connections, rejecting {partner}', 'http_server:serve_http_client')
+            try:
+                await self.send_simple_response(writer, HTTP_STATUS_SERVICE_UNAVAILABLE, self.CT_TEXT_TEXT,
+                                                b'server busy\r\n', [b'Retry-After: 1'])
+                writer.close()
+                await writer.wait_closed()
+            except OSError:
+                pass
+            return
+        try:
+            await self._serve_connection(reader, writer, partner)
+        finally:
+            if writer in self._unslotted:
+                self._unslotted.discard(writer)
+            else:
+                self._release_connection()
+
+    async def _serve_connection(self, reader, writer, partner):
         if logging.should_log(logging.DEBUG):
             logging.debug(f'web client connected from {partner}', 'http_server:serve_http_client')
-        request_line = await reader.readline()
-        request = request_line.strip()
+        keep_alive = self._keep_alive
+        head_buffers = self._head_buffers
+        request_reader = _RequestReader(reader, head_buffers.pop() if len(head_buffers) > 0
+                                        else bytearray(_HEAD_BUFFER_SIZE))
+        requests_served = 0
+        try:
+            while True:
+                keep_alive[writer] = False
+                if requests_served == 0:
+                    try:
+                        head_start, head_end = await asyncio.wait_for(request_reader.read_head(), self.head_timeout)
+                    except TimeoutError:
+                        self.head_timeouts += 1
+                        if logging.should_log(logging.DEBUG):
+                            logging.debug(f'no request from {partner} in time, closing',
+                                          'http_server:serve_http_client')
+                        break
+                else:
+                    self._drop_slot(writer)  # an idle kept alive connection does not hold a slot.
+                    try:
+                        head_start, head_end = await asyncio.wait_for(request_reader.read_head(),
+                                                                      self.keep_alive_timeout)
+                    except TimeoutError:
+                        if logging.should_log(logging.DEBUG):
+                            logging.debug(f'keep-alive connection from {partner} idle, closing',
+                                          'http_server:serve_http_client')
+                        break
+                    if head_end != 0 and not await self._regain_slot(writer):
+                        self.connections_rejected += 1
+                        await self.send_simple_response(writer, HTTP_STATUS_SERVICE_UNAVAILABLE, self.CT_TEXT_TEXT,
+                                                        b'server busy\r\n', [b'Retry-After: 1'])
+                        break
+                if head_end == 0:  # client closed the connection
+                    break
+                if head_end < 0:
+                    logging.warning(f'request head from {partner} is too large', 'http_server:serve_http_client')
+                    await self.send_simple_response(writer, HTTP_STATUS_HEADERS_TOO_LARGE, self.CT_TEXT_TEXT,
+                                                    b'request head too large\r\n')
+                    break
+                requests_served += 1
+                request_line, request_headers = request_reader.parse_head(head_start, head_end)
+                request_reader.timeout = self.body_timeout
+                request_reader.timed_out = False
+                reuse = await self.serve_http_request(request_reader, writer, request_line, request_headers, partner,
+                                                      requests_served < self.max_keep_alive_requests)
+                if not reuse:
+                    break
+        except OSError as ose:  # the client went away
+            if logging.should_log(logging.DEBUG):
+                logging.debug(f'connection from {partner} lost: {ose}', 'http_server:serve_http_client')
+        except Exception as exc:
+            logging.exception(f'error serving {partner}', 'http_server:serve_http_client', exc_info=exc)
+        finally:
+            keep_alive.pop(writer, None)
+            if len(head_buffers) < _HEAD_BUFFER_POOL:
+                head_buffers.append(request_reader.buffer)
+        try:
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+    async def _serve_stream(self, route, verb, args, reader, writer, request_headers):
+        """
+        run a long lived callback.  streams count against max_streams instead of max_connections.
+        """
+        if self.streams_active >= self.max_streams:
+            self.streams_rejected += 1
+            self._keep_alive[writer] = False
+            http_status = HTTP_STATUS_SERVICE_UNAVAILABLE
+            bytes_sent = await self.send_simple_response(writer, http_status, self.CT_TEXT_TEXT,
+                                                         b'too many streams\r\n', [b'Retry-After: 5'])
+            return bytes_sent, http_status
+        reader.timeout = None
+        self._drop_slot(writer)
+        self.streams_active += 1
+        if self.streams_active > self.streams_peak:
+            self.streams_peak = self.streams_active
+        try:
+            result = await route.callback(self, verb, args, reader, writer, request_headers)
+        finally:
+            self.streams_active -= 1
+        # a finished long poll can keep its connection only if a slot is free right now.
+        if self._keep_alive.get(writer, False) and not await self._regain_slot(writer, False):
+            self._keep_alive[writer] = False
+        return result
+
+    async def _with_deadline(self, reader, writer, response):
+        """
+        await a response coroutine for at most response_timeout seconds.  after a timeout the connection
+        is closed, since part of the response may already be sent.
+        no garbage is collected while the response is being made, unless the heap is nearly full.
+        """
+        try:
+            with gc_manager.busy():
+                return await asyncio.wait_for(response, self.response_timeout)
+        except TimeoutError:
+            if reader.timed_out:  # a read of the request body stalled
+                self.body_timeouts += 1
+            else:
+                self.response_timeouts += 1
+            self._keep_alive[writer] = False
+            return 0, HTTP_STATUS_REQUEST_TIMEOUT
+
+    async def serve_http_request(self, reader, writer, request_line, request_headers, partner,
+                                 may_keep_alive=True) -> bool:
+        """
+        serve one request on a connection.  request_headers only has the headers the server uses,
+        with lower case names.  returns True if the connection can be used for another request.
+        """
+        t0 = milliseconds()
+        http_status = HTTP_STATUS_INTERNAL_SERVER_ERROR
+        bytes_sent = 0
+        request = request_line
         if logging.should_log(logging.DEBUG):
-            logging.debug(f'request: {request}', 'http_server:serve_http_client')
+            logging.debug(f'request: {request}', 'http_server:serve_http_request')
         pieces = request.split(b' ')
         if len(pieces) != 3:  # does the http request line look approximately correct?
             http_status = HTTP_STATUS_BAD_REQUEST
@@ -282,38 +1221,38 @@ class HttpServer:
                 query_args = b''
             if verb not in [HTTP_VERB_GET, HTTP_VERB_POST]:
                 http_status = HTTP_STATUS_BAD_REQUEST
-                logging.warning(f'Bad request, wrong verb {verb}', 'http_server:serve_http_client')
+                logging.warning(f'Bad request, wrong verb {verb}', 'http_server:serve_http_request')
                 response = b'<html><body><p>only GET and POST are supported</p></body></html>'
                 bytes_sent = await self.send_simple_response(writer, http_status, self.CT_TEXT_HTML, response)
             elif protocol not in {b'HTTP/1.0', b'HTTP/1.1'}:
-                logging.warning(f'bad request, wrong http protocol {protocol}', 'http_server:serve_http_client')
+                logging.warning(f'bad request, wrong http protocol {protocol}', 'http_server:serve_http_request')
                 http_status = HTTP_STATUS_BAD_REQUEST
                 response = b'protocol %s is not supported' % protocol
                 bytes_sent = await self.send_simple_response(writer, http_status, self.CT_TEXT_HTML, response)
             else:
-                # get HTTP request headers
-                request_content_length = 0
-                request_content_type = b''
-                request_headers = {}
-                while True:
-                    header = await reader.readline()
-                    if header in (b'', b'\r\n'):
-                        break
-                    # process headers.  look for those we are interested in.
-                    if b':' not in header:  # ignore malformed header
-                        continue
-                    parts = header.split(b':', 1)
-                    header_name = parts[0].strip().lower()
-                    header_value = parts[1].strip()
-                    request_headers[header_name] = header_value
-                    if header_name == b'content-length':
-                        request_content_length = safe_int(header_value, -1)
-                    elif header_name == b'content-type':
-                        request_content_type = header_value
+                request_content_length = safe_int(request_headers.get(b'content-length', 0), -1)
+                request_content_type = request_headers.get(b'content-type', b'')
+                # can the connection be reused after this request?  HTTP/1.1 defaults to yes, HTTP/1.0 to no.
+                connection = request_headers.get(b'connection', b'').lower()
+                if protocol == b'HTTP/1.1':
+                    reuse = connection != b'close'
+                else:
+                    reuse = connection == b'keep-alive'
+                # the request body must be completely consumed before the next request can be read.
+                body_consumed = request_content_length == 0
                 args = {}
-                if verb == HTTP_VERB_GET:
+                if b'transfer-encoding' in request_headers:
+                    # chunked bodies are not supported, and a body without a length cannot be skipped,
+                    # so the rest of the connection cannot be trusted.
+                    self._keep_alive[writer] = False
+                    http_status = HTTP_STATUS_LENGTH_REQUIRED
+                    response = b'Transfer-Encoding is not supported, send Content-Length\r\n'
+                    bytes_sent = await self.send_simple_response(writer, http_status, self.CT_TEXT_TEXT, response)
+                    verb = None  # prevent further processing
+                elif verb == HTTP_VERB_GET:
                     args = self.unpack_args(query_args)
                 elif verb == HTTP_VERB_POST:
+                    args = self.unpack_args(query_args)  # replaced by the body's arguments if it is a form.
                     if request_content_length > 0:
                         if request_content_type.startswith(self.CT_APP_WWW_FORM) or request_content_type.startswith(self.CT_APP_JSON):
                             if request_content_length > _BUFFER_SIZE:
@@ -322,7 +1261,16 @@ class HttpServer:
                                 bytes_sent = await self.send_simple_response(writer, http_status, self.CT_TEXT_TEXT, response)
                                 verb = None  # prevent further processing
                             else:
-                                data = await reader.read(request_content_length)
+                                try:
+                                    data = await reader.readexactly(request_content_length)
+                                except TimeoutError:
+                                    self.body_timeouts += 1
+                                    http_status = HTTP_STATUS_REQUEST_TIMEOUT
+                                    response = b'request body timed out'
+                                    bytes_sent = await self.send_simple_response(writer, http_status, self.CT_TEXT_TEXT, response)
+                                    verb = None  # prevent further processing
+                            if verb is not None:
+                                body_consumed = True
                                 if request_content_type.startswith(self.CT_APP_WWW_FORM):
                                     args = self.unpack_args(data)
                                 elif request_content_type.startswith(self.CT_APP_JSON):
@@ -331,34 +1279,50 @@ class HttpServer:
                                     except Exception as e:
                                         args = {}
                                         logging.error(f'cannot decode posted JSON "{data}": {e}',
-                                                      'http_server:serve_http_client')
-                        elif not request_content_type.startswith(self.CT_MULTIPART_FORM):
+                                                      'http_server:serve_http_request')
+                        elif not (request_content_type.startswith(self.CT_MULTIPART_FORM)
+                                  or request_content_type.startswith(self.CT_APP_TAR)):
                             logging.warning(f'warning: unhandled content_type {request_content_type}',
-                                            'http_server:serve_http_client')
+                                            'http_server:serve_http_request')
                             logging.warning(f'request_content_length={request_content_length}',
-                                            'http_server:serve_http_client')
+                                            'http_server:serve_http_request')
                 else:  # bad request
                     http_status = HTTP_STATUS_BAD_REQUEST
                     response = b'only GET and POST are supported'
-                    logging.warning(response, 'http_server:serve_http_client')
+                    logging.warning(response, 'http_server:serve_http_request')
                     bytes_sent = await self.send_simple_response(writer, http_status, self.CT_TEXT_TEXT, response)
 
                 if verb in (HTTP_VERB_GET, HTTP_VERB_POST):
-                    callback = self.uri_map.get(target)
-                    if callback is not None:
-                        bytes_sent, http_status = await callback(self, verb, args, reader, writer, request_headers)
+                    self._keep_alive[writer] = reuse and body_consumed and may_keep_alive
+                    route = self.uri_map.get(target)
+                    if route is not None:
+                        bad_arg = validate_args(route.schema, args)
+                        if verb not in route.verbs:
+                            http_status = HTTP_STATUS_METHOD_NOT_ALLOWED
+                            response = b'%s not allowed\r\n' % verb
+                            bytes_sent = await self.send_simple_response(writer, http_status, self.CT_TEXT_TEXT,
+                                                                         response, [route.allow_header])
+                        elif bad_arg is not None:
+                            http_status = HTTP_STATUS_BAD_REQUEST
+                            response = b'bad %s parameter\r\n' % bad_arg.encode()
+                            bytes_sent = await self.send_simple_response(writer, http_status, self.CT_TEXT_TEXT, response)
+                        elif route.long_lived:
+                            bytes_sent, http_status = await self._serve_stream(route, verb, args, reader, writer,
+                                                                               request_headers)
+                        else:
+                            bytes_sent, http_status = await self._with_deadline(
+                                reader, writer, route.callback(self, verb, args, reader, writer, request_headers))
                     else:
                         content_file = target[1:] if target.startswith(b'/') else target
-                        bytes_sent, http_status = await self.serve_content(writer, content_file.decode())
+                        bytes_sent, http_status = await self._with_deadline(
+                            reader, writer, self.serve_content(writer, content_file.decode(), request_headers))
 
         await writer.drain()
-        writer.close()
-        await writer.wait_closed()
-        elapsed = milliseconds() - t0
+        elapsed = ticks_diff(milliseconds(), t0)
         if logging.should_log(logging.INFO):
             logging.info(f'{partner} {request} {http_status} {bytes_sent} {elapsed} ms',
-                         'http_server:serve_http_client')
-        gc.collect()
+                         'http_server:serve_http_request')
+        return self._keep_alive.get(writer, False)
 
 #
 # common file operations callbacks, here because just about every app will use them...
@@ -385,6 +1349,33 @@ def file_size(filename):
         return -1
 
 
+def file_size_mtime(filename):
+    """
+    return (size, mtime) for a file, or (-1, 0) if it does not exist.
+    """
+    try:
+        stat = os.stat(filename)
+        return safe_int(stat[6], -1), safe_int(stat[8], 0)
+    except OSError:
+        return -1, 0
+
+
+def remove_gzip_sibling(http, filename):
+    """
+    a name.gz copy is only good for the file it was made from, so remove it when that file is replaced or removed.
+    """
+    if filename.endswith('.gz'):
+        return
+    gzip_filename = filename + '.gz'
+    http.invalidate_content(gzip_filename)
+    if file_size(gzip_filename) >= 0:
+        try:
+            os.remove(gzip_filename)
+            logging.info(f'removed stale {gzip_filename}', 'http_server:remove_gzip_sibling')
+        except OSError as ose:
+            logging.warning(f'cannot remove {gzip_filename}: {ose}', 'http_server:remove_gzip_sibling')
+
+
 # noinspection PyUnusedLocal
 async def api_get_files_callback(http, verb, args, reader, writer, request_headers=None):
     if verb == HTTP_VERB_GET:
@@ -400,135 +1391,176 @@ async def api_get_files_callback(http, verb, args, reader, writer, request_heade
 
 # noinspection PyUnusedLocal
 async def api_upload_file_callback(http, verb, args, reader, writer, request_headers=None):
-    if verb == HTTP_VERB_POST:
-        logging.debug('http post handler', 'http_server:api_upload_file_callback')
-        boundary = None
-        request_content_type = b''
-        request_content_length = -1
-        for header_name in request_headers.keys():
-            lower_header_name = header_name.lower()
-            if lower_header_name == b'content-type':
-                request_content_type = request_headers.get(header_name)
-            elif lower_header_name == b'content-length':
-                request_content_length = safe_int(request_headers.get(header_name), -1)
-
-        if b';' in request_content_type:
-            pieces = request_content_type.split(b';')
-            request_content_type = pieces[0]
-            boundary = pieces[1].strip()
-            if boundary.startswith(b'boundary='):
-                boundary = boundary[9:]
-        if request_content_type != http.CT_MULTIPART_FORM or boundary is None:
-            response = b'multipart boundary or content type error'
-            http_status = HTTP_STATUS_BAD_REQUEST
-        else:
-            response = b'unhandled problem'
-            http_status = HTTP_STATUS_INTERNAL_SERVER_ERROR
-            if request_content_length == -1:
-                response = b'invalid Content-Length'
-                http_status = HTTP_STATUS_BAD_REQUEST
-            elif request_content_length == 0:
-                response = b'file is too small'
-                http_status = HTTP_STATUS_LENGTH_REQUIRED
-            elif request_content_length > _MAX_UPLOAD_SIZE:
-                response = b'file is too big'
-                http_status = HTTP_STATUS_CONTENT_TOO_LARGE
-            else:
-                remaining_content_length = request_content_length
-                logging.info(f'upload content length {request_content_length}', 'http_server:api_upload_file_callback')
-                start_boundary = http.HYPHENS + boundary
-                end_boundary = start_boundary + http.HYPHENS
-                search_boundary = b'\r\n' + start_boundary
-                keep_len = len(search_boundary) - 1
-                state = _MP_START_BOUND
-                filename = None
-                output_file = None
-                more_bytes = True
-                leftover_bytes = b''
-                try:
-                    while more_bytes:
-                        buffer = await reader.read(_BUFFER_SIZE)
-                        remaining_content_length -= len(buffer)
-                        if remaining_content_length <= 0:
-                            more_bytes = False
-                        if len(leftover_bytes) != 0:
-                            buffer = leftover_bytes + buffer
-                            leftover_bytes = b''
-                        start = 0
-                        while start < len(buffer):
-                            if state == _MP_DATA:
-                                if not output_file:
-                                    output_filename = _safe_content_path(http.content_dir, 'uploaded_' + str(filename))
-                                    output_file = open(output_filename, 'wb')
-                                idx = buffer.find(search_boundary, start)
-                                if idx != -1:
-                                    output_file.write(buffer[start:idx])
-                                    state = _MP_END_BOUND
-                                    output_file.close()
-                                    output_file = None
-                                    response = b'Uploaded "uploaded_%s" successfully' % filename.encode()
-                                    http_status = HTTP_STATUS_CREATED
-                                    start = idx + 2  # Advance past \r\n so the next line parsed is the boundary itself
-                                else:
-                                    if more_bytes and len(buffer) - start > keep_len:
-                                        leftover_bytes = buffer[-keep_len:]
-                                        output_file.write(buffer[start:-keep_len])
-                                        start = len(buffer)
-                                    else:
-                                        output_file.write(buffer[start:])
-                                        start = len(buffer)
-                            else:  # must be reading headers or boundary
-                                idx = buffer.find(b'\r\n', start)
-                                if idx != -1:
-                                    line = buffer[start:idx]
-                                    start = idx + 2
-                                    if state == _MP_START_BOUND:
-                                        if line == start_boundary or line == b'':
-                                            if line == start_boundary:
-                                                state = _MP_HEADERS
-                                    elif state == _MP_HEADERS:
-                                        if len(line) == 0:
-                                            state = _MP_DATA
-                                        elif line.startswith(b'Content-Disposition:'):
-                                            pieces = line.split(b';')
-                                            if len(pieces) >= 3:
-                                                fn = pieces[2].strip()
-                                                if fn.startswith(b'filename="'):
-                                                    filename = fn[10:-1].decode()
-                                                    if not valid_filename(filename):
-                                                        response = b'bad filename'
-                                                        http_status = HTTP_STATUS_BAD_REQUEST
-                                                        more_bytes = False
-                                                        start = len(buffer)
-                                    elif state == _MP_END_BOUND:
-                                        if line == end_boundary or line == start_boundary or line == b'--':
-                                            state = _MP_START_BOUND
-                                else:
-                                    if more_bytes:
-                                        leftover_bytes = buffer[start:]
-                                        start = len(buffer)
-                                    else:
-                                        start = len(buffer)
-                finally:
-                    if output_file is not None:
-                        output_file.close()
-                        output_file = None
-        logging.info(f'upload response: {response}', 'http_server:api_upload_file_callback')
-        bytes_sent = await http.send_simple_response(writer, http_status, http.CT_TEXT_TEXT, response)
-    else:
-        response = b'POST only.'
+    """
+    receive multipart/form-data file uploads.  the body is read into the server's buffer with readinto,
+    and the boundary is found by a KMP matcher that carries its state from one read to the next,
+    so the file data is written straight from the buffer.  each file is written to a .tmp file that
+    is renamed over uploaded_<filename> only when the whole part has arrived.
+    """
+    logging.debug('http post handler', 'http_server:api_upload_file_callback')
+    boundary = None
+    request_content_type = request_headers.get(b'content-type', b'')
+    request_content_length = safe_int(request_headers.get(b'content-length'), -1)
+    if b';' in request_content_type:
+        pieces = request_content_type.split(b';')
+        request_content_type = pieces[0]
+        boundary = pieces[1].strip()
+        if boundary.startswith(b'boundary='):
+            boundary = boundary[9:]
+    if request_content_type != http.CT_MULTIPART_FORM or boundary is None or len(boundary) == 0:
+        response = b'multipart boundary or content type error'
         http_status = HTTP_STATUS_BAD_REQUEST
-        bytes_sent = await http.send_simple_response(writer, http_status, http.CT_TEXT_TEXT, response)
+    elif request_content_length == -1:
+        response = b'invalid Content-Length'
+        http_status = HTTP_STATUS_BAD_REQUEST
+    elif request_content_length == 0:
+        response = b'file is too small'
+        http_status = HTTP_STATUS_LENGTH_REQUIRED
+    elif request_content_length > _MAX_UPLOAD_SIZE:
+        response = b'file is too big'
+        http_status = HTTP_STATUS_CONTENT_TOO_LARGE
+    else:
+        logging.info(f'upload content length {request_content_length}', 'http_server:api_upload_file_callback')
+        async with http.buffer_lock:
+            http_status, response = await _receive_multipart(http, reader, boundary, request_content_length)
+    logging.info(f'upload response: {response}', 'http_server:api_upload_file_callback')
+    bytes_sent = await http.send_simple_response(writer, http_status, http.CT_TEXT_TEXT, response)
     return bytes_sent, http_status
 
 
+async def _receive_multipart(http, reader, boundary, remaining):
+    """
+    parse a multipart body of remaining bytes, writing the file parts.  returns (http status, response).
+    """
+    buffer = http.buffer
+    bmv = http.bmv
+    delimiter = b'\r\n' + http.HYPHENS + boundary
+    delimiter_length = len(delimiter)
+    table = _kmp_table(delimiter)
+    matched = 2  # the first boundary has no CRLF in front of it, so start as if one was just seen.
+    state = _MP_START_BOUND
+    filename = None
+    temp_filename = None
+    output_file = None
+    http_status = HTTP_STATUS_BAD_REQUEST
+    response = b'no file in upload'
+    fill = 0  # bytes kept at the front of the buffer, an incomplete header line
+    try:
+        while state != _MP_DONE:
+            if remaining == 0:
+                # a body may end right after the closing '--' with no CRLF.
+                if state != _MP_END_BOUND or fill < 2 or buffer[0] != 45 or buffer[1] != 45:
+                    http_status = HTTP_STATUS_BAD_REQUEST
+                    response = b'incomplete upload'
+                break
+            want = _BUFFER_SIZE - fill
+            if want > remaining:
+                want = remaining
+            count = await reader.readinto(bmv[fill:fill + want])
+            if count == 0:
+                http_status = HTTP_STATUS_BAD_REQUEST
+                response = b'incomplete upload'
+                break
+            remaining -= count
+            end = fill + count
+            pos = 0
+            fill = 0
+            while pos < end and state != _MP_DONE:
+                if state == _MP_DATA or state == _MP_START_BOUND:
+                    # bytes of a partial delimiter match are not written until the match fails;
+                    # they are always a prefix of the delimiter, so they are written from it.
+                    result = _find_boundary(buffer, pos, end, delimiter, table, matched)
+                    if result >= 0:
+                        data_end = end - result
+                        if data_end >= pos:
+                            held = matched
+                        else:
+                            held = matched - (pos - data_end)
+                            data_end = pos
+                        matched = result
+                        next_pos = end
+                    else:
+                        next_pos = -1 - result
+                        data_end = next_pos - delimiter_length
+                        if data_end >= pos:
+                            held = matched
+                        else:
+                            held = matched - (pos - data_end)
+                            data_end = pos
+                        matched = 0
+                    if output_file is not None:
+                        if held > 0:
+                            output_file.write(delimiter[:held])
+                        if data_end > pos:
+                            output_file.write(bmv[pos:data_end])
+                    pos = next_pos
+                    if result < 0:
+                        if output_file is not None:
+                            output_file.close()
+                            output_file = None
+                            output_filename = _safe_content_path(http.content_dir, 'uploaded_' + filename)
+                            http.invalidate_content(output_filename)
+                            remove_gzip_sibling(http, output_filename)
+                            os.rename(temp_filename, output_filename)  # replaces an existing file
+                            temp_filename = None
+                            http_status = HTTP_STATUS_CREATED
+                            response = b'Uploaded "uploaded_%s" successfully' % filename.encode()
+                        filename = None
+                        state = _MP_END_BOUND
+                else:  # a header line, or the rest of a boundary line
+                    idx = _find_crlf(buffer, pos, end)
+                    if idx < 0:
+                        fill = end - pos
+                        if fill == _BUFFER_SIZE:
+                            http_status = HTTP_STATUS_BAD_REQUEST
+                            response = b'multipart header line too long'
+                            state = _MP_DONE
+                        elif pos > 0:
+                            buffer[:fill] = bytes(bmv[pos:end])
+                        break
+                    if state == _MP_END_BOUND:
+                        if idx - pos >= 2 and buffer[pos] == 45 and buffer[pos + 1] == 45:  # '--'
+                            state = _MP_DONE
+                        else:
+                            state = _MP_HEADERS
+                    elif idx == pos:  # the blank line after the part headers
+                        if filename is not None:
+                            if not valid_filename(filename):
+                                http_status = HTTP_STATUS_BAD_REQUEST
+                                response = b'bad filename'
+                                state = _MP_DONE
+                                break
+                            temp_filename = _safe_content_path(http.content_dir, 'uploaded_' + filename + '.tmp')
+                            output_file = open(temp_filename, 'wb')
+                        state = _MP_DATA
+                    else:
+                        line = bytes(bmv[pos:idx])
+                        if line[:20].lower() == b'content-disposition:':
+                            fn = line.find(b'filename="')
+                            if fn >= 0:
+                                fn_end = line.find(b'"', fn + 10)
+                                filename = line[fn + 10:fn_end if fn_end > 0 else len(line)].decode()
+                    pos = idx + 2
+    finally:
+        if output_file is not None:
+            output_file.close()
+        if temp_filename is not None:
+            try:
+                os.remove(temp_filename)
+            except OSError:
+                pass
+    return http_status, response
+
+
 # noinspection PyUnusedLocal
 async def api_remove_file_callback(http, verb, args, reader, writer, request_headers=None):
     filename = args.get('filename')
     if valid_filename(filename) and filename not in HttpServer.DANGER_ZONE_FILE_NAMES:
         filename = _safe_content_path(http.content_dir, filename)
+        http.invalidate_content(filename)
         try:
             os.remove(filename)
+            remove_gzip_sibling(http, filename)
             http_status = HTTP_STATUS_OK
             response = f'removed {filename}'.encode('utf-8')
         except OSError as ose:
@@ -552,8 +1584,15 @@ async def api_rename_file_callback(http, verb, args, reader, writer, request_hea
             http_status = HTTP_STATUS_CONFLICT
             response = f'new file {newname} already exists'.encode('utf-8')
         else:
+            http.invalidate_content(filename)
+            http.invalidate_content(newname)
             try:
                 os.rename(filename, newname)
+                # the compressed copy follows the file it was made from.
+                remove_gzip_sibling(http, newname)
+                if not newname.endswith('.gz') and file_size(filename + '.gz') >= 0:
+                    http.invalidate_content(filename + '.gz')
+                    os.rename(filename + '.gz', newname + '.gz')
                 http_status = HTTP_STATUS_OK
                 response = f'renamed {filename} to {newname}'.encode('utf-8')
             except Exception as ose:
@@ -22,16 +22,15 @@ LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
 OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
 OF THE POSSIBILITY OF SUCH DAMAGE.
 """
-__version__ = '0.9.4'  # 2026-07-09
+__version__ = '0.9.7'  # 2026-10-19
 
 # disable pylint import error
 # pylint: disable=E0401
 
 import asyncio
-import gc
 import micro_logging as logging
 
-from kdevice import KDevice, ClientData, BufferAndLength
+from kdevice import KDevice, BufferAndLength
 from utils import upython, milliseconds, safe_int
 
 if upython:
@@ -63,6 +62,11 @@ class KAT500(KDevice):
         b'tuner::meter::VSWRB',       # 14: '1.65'
     )
 
+    data_name = 'kat500_data'
+
+    # the order that items are sent to a newly connected client.
+    initial_update_order = (9, 4, 5, 0, 1, 2, 3, 6, 8, 7, 13, 14, 11, 12, 10)
+
     fault_texts = ('NO FAULT',                   # 0
                    'NO MATCH',                   # 1
                    'POWER ABOVE DESIGN LIMIT',   # 2
@@ -213,6 +217,7 @@ class KAT500(KDevice):
         run_loop = True
 
         while run_loop:
+            self.poll_state = tuner_state
             if tuner_state == 0:  # unknown / no response state
                 # poke at the tuner -- is it connected?
                 await self.device_send_receive(b';', bl)
@@ -315,9 +320,7 @@ class KAT500(KDevice):
         t0 = milliseconds()
         extra = writer.get_extra_info('peername')
         client_name = f'{extra[0]}:{extra[1]}'
-        client_data = ClientData(client_name)
-        client_data.update_list.extend((9, 4, 5, 0, 1, 2, 3, 6, 8, 7, 13, 14, 11, 12, 10))  # items to send.
-        self.network_clients.append(client_data)
+        client_data = self.add_network_client(writer, client_name)
         logging.info(f'client {client_name} connected', 'kat500:serve_kat500_remote_client')
 
         try:
@@ -351,8 +354,9 @@ class KAT500(KDevice):
                                        b'Remote control will not be allowed.\n'
                         else:
                             response = b'server::login::valid\n'
-                            client_data.authorized = True
+                            self.client_logged_in(client_data)
                         writer.write(response)
+                        client_data.bytes_sent += len(response)
                         client_data.last_activity = milliseconds()
                         logging.debug(f'sending "{response.decode().strip()}"', 'kat500:serve_kat500_remote_client')
                     else:
@@ -427,29 +431,36 @@ class KAT500(KDevice):
                         client_data.connected = False
 
                 # send any outstanding data back...
-                if len(client_data.update_list) > 0:
+                if client_data.full_state_pending:
+                    self.write_full_state(client_data, writer)
+                    await writer.drain()
+                    client_data.last_activity = client_data.last_update = milliseconds()
+                if self.updates_due(client_data, milliseconds()):
                     while len(client_data.update_list) > 0:
                         index = client_data.update_list.popleft()
                         client_data.update_set.discard(index)
                         try:
-                            writer.write(self.key_names[index])
+                            key_name = self.key_names[index]
+                            writer.write(key_name)
                             payload = f'::{self.device_data[index]}\n'.encode()
                             writer.write(payload)
+                            client_data.bytes_sent += len(key_name) + len(payload)
+                            client_data.updates_sent += 1
                         except (BrokenPipeError, ConnectionResetError):
                             client_data.connected = False
                             break
                         logging.debug(f'sent "{self.key_names[index].decode()}{payload.decode().strip()}"',
                                       'kat500:serve_kat500_remote_client')
                     await writer.drain()
-                    client_data.last_activity = milliseconds()
+                    client_data.last_activity = client_data.last_update = milliseconds()
 
-                since_last_activity = milliseconds() - client_data.last_activity
-                if since_last_activity > 15000:
+                if client_data.keepalive_due:
+                    client_data.keepalive_due = False
                     writer.write(b'\n')
+                    client_data.bytes_sent += 1
                     await writer.drain()
                     client_data.last_activity = milliseconds()
                     logging.debug(f'SENT keepalive TO client {client_name}', 'kat500:serve_kat500_remote_client')
-                    gc.collect()
 
             # connection closing
             logging.info(f'client {client_name} connection closing...', 'kat500:serve_kat500_remote_client')
@@ -461,15 +472,10 @@ class KAT500(KDevice):
                           'kat500:serve_kat500_remote_client')
         finally:
             logging.info(f'client {client_name} disconnected', 'kat500:serve_kat500_remote_client')
-            found_network_client = None
-            for network_client in self.network_clients:
-                if network_client.client_name == client_data.client_name:
-                    found_network_client = network_client
-                    break
-            if found_network_client is not None:
-                self.network_clients.remove(found_network_client)
+            if self.remove_network_client(writer) is not None:
                 logging.info(f'client {client_name} removed from network_clients list.',
                              'kat500:serve_kat500_remote_client')
         tc = milliseconds()
-        logging.info(f'client {client_name} disconnected, elapsed time {((tc - t0) / 1000.0):6.3f} seconds',
+        logging.info(f'client {client_name} disconnected, elapsed time {((tc - t0) / 1000.0):6.3f} seconds, '
+                     f'{client_data.updates_sent} updates, {client_data.bytes_sent} bytes sent',
                      'kat500:serve_kat500_remote_client')
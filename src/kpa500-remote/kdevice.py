@@ -21,12 +21,33 @@ LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
 OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
 OF THE POSSIBILITY OF SUCH DAMAGE.
 """
-__version__ = '0.9.5'  # 2026-07-10
+__version__ = '0.9.13'  # 2026-10-19
 
 import asyncio
 from collections import deque
+import json
 import micro_logging as logging
+from gc_manager import gc_manager
 from serialport import SerialPort
+from timing_wheel import TimingWheel
+from utils import milliseconds, ticks_diff, upython
+
+if upython:
+    from asyncio import TimeoutError
+else:
+    from asyncio.exceptions import TimeoutError
+
+# network client roles.
+ROLE_NONE = 0  # receives no updates until it logs in.
+ROLE_OBSERVE = 1  # receives updates, cannot control the device.
+ROLE_CONTROL = 2  # logged in, receives updates and can control the device.
+ROLE_NAMES = ('none', 'observe', 'control')
+
+# the state of the device polling loop.
+POLL_STATE_NAMES = ('not connected', 'connecting', 'power off', 'power on')
+
+KEEPALIVE_MS = 15000  # send a keepalive to a client that has had no traffic for this long.
+
 
 class ClientData:
     """
@@ -37,8 +58,71 @@ class ClientData:
         self.update_list = deque((), 32, 1)  # this is the proper syntax for Micropython.
         self.update_set = set()
         self.authorized = False
+        self.role = ROLE_OBSERVE
         self.connected = True
-        self.last_activity = 0
+        self.last_activity = milliseconds()
+        self.last_update = 0
+        self.keepalive_due = False
+        self.full_state_pending = False
+        self.connect_time = milliseconds()
+        self.bytes_sent = 0
+        self.updates_sent = 0
+
+    def stats(self) -> dict:
+        return {'client': self.client_name,
+                'authorized': self.authorized,
+                'role': ROLE_NAMES[self.role],
+                'connected_ms': ticks_diff(milliseconds(), self.connect_time),
+                'bytes_sent': self.bytes_sent,
+                'updates_sent': self.updates_sent,
+                }
+
+
+class ClientRegistry:
+    """
+    network clients, keyed by connection (the stream writer) so removal is O(1).
+    iteration is over a tuple snapshot that is only rebuilt when a client is added or removed,
+    so fan-out in update_device_data does no allocation and is safe while clients come and go.
+    """
+    def __init__(self):
+        self._clients = {}
+        self._snapshot = ()
+
+    def add(self, key, client_data: ClientData):
+        self._clients[key] = client_data
+        self._snapshot = None
+
+    def remove(self, key) -> ClientData | None:
+        client_data = self._clients.pop(key, None)
+        if client_data is not None:
+            self._snapshot = None
+        return client_data
+
+    def get(self, key) -> ClientData | None:
+        return self._clients.get(key)
+
+    def snapshot(self) -> tuple:
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self._snapshot = tuple(self._clients.values())
+        return snapshot
+
+    def stats(self) -> list:
+        return [client_data.stats() for client_data in self.snapshot()]
+
+    def __len__(self):
+        return len(self._clients)
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+
+def _keepalive_due(client_data: ClientData):
+    client_data.keepalive_due = True
+
+
+# one timer for the keepalives of every network client of every device.
+keepalive_timer = TimingWheel(KEEPALIVE_MS, _keepalive_due)
 
 
 class BufferAndLength:
@@ -64,13 +148,33 @@ class BufferAndLength:
 
 
 class KDevice:
+    # the names of the device_data items, and the order they are sent to a newly connected client,
+    # set by the subclass.
+    key_names = ()
+    initial_update_order = ()
+    # the name of the device_data list in JSON status responses, set by the subclass.
+    data_name = 'device_data'
+
     def __init__(self, username=None, password=None, port_name=None, data_size=0):
         self.username = username
         self.password = password
         self.port_name = port_name
         self.device_command_queue = deque((), 64, 1)  # this is the proper syntax for Micropython.
-        self.network_clients = []
+        self.network_clients = ClientRegistry()
+        self.unauthenticated_role = ROLE_OBSERVE
+        self.observer_update_ms = 0
+        self.status_publisher = None
+        self._full_state_frame = None
+        self._change_event = None
+        self.version = 0  # incremented for every device_data change.
+        self._status_json = None
+        self._status_json_version = -1
         self.device_data = ['0'] * data_size
+        self.change_versions = [0] * data_size  # the version at which each item last changed.
+        self.poll_state = 0  # index into POLL_STATE_NAMES, set by the polling loop.
+        self.polls_sent = 0
+        self.poll_timeouts = 0
+        self.last_response_time = 0  # milliseconds() when the device last answered.
         self.device_port = SerialPort(name=port_name, baudrate=38400, timeout=0)  # timeout is zero for non-blocking
 
     def enqueue_command(self, command):
@@ -90,15 +194,153 @@ class KDevice:
             return None
         return dcq.popleft()
 
+    def set_client_policy(self, unauthenticated_role=ROLE_OBSERVE, observer_update_ms=0):
+        """
+        set the role given to clients that have not logged in, and the minimum time between
+        update batches sent to observers.  ROLE_NONE clients get no updates until they log in.
+        """
+        if unauthenticated_role not in (ROLE_NONE, ROLE_OBSERVE):
+            logging.warning(f'invalid unauthenticated role {unauthenticated_role}, using observe',
+                            'kdevice:set_client_policy')
+            unauthenticated_role = ROLE_OBSERVE
+        self.unauthenticated_role = unauthenticated_role
+        self.observer_update_ms = max(0, observer_update_ms)
+
+    def add_network_client(self, key, client_name, role=None) -> ClientData:
+        client_data = ClientData(client_name)
+        client_data.role = self.unauthenticated_role if role is None else role
+        if client_data.role != ROLE_NONE:
+            client_data.full_state_pending = True
+        self.network_clients.add(key, client_data)
+        keepalive_timer.add(client_data)
+        return client_data
+
+    def remove_network_client(self, key) -> ClientData | None:
+        client_data = self.network_clients.remove(key)
+        if client_data is not None:
+            keepalive_timer.remove(client_data)
+        return client_data
+
+    def client_logged_in(self, client_data: ClientData):
+        if client_data.role == ROLE_NONE:
+            client_data.full_state_pending = True  # it has not been sent anything yet.
+        client_data.role = ROLE_CONTROL
+        client_data.authorized = True
+
+    def full_state_frame(self) -> bytes:
+        """
+        every device_data item, in initial_update_order, in the Elecraft remote wire format.
+        built when needed and kept until any item changes, so a storm of (re)connecting clients
+        costs one encode and one write each.
+        """
+        frame = self._full_state_frame
+        if frame is None:
+            key_names = self.key_names
+            device_data = self.device_data
+            parts = []
+            for index in self.initial_update_order:
+                parts.append(key_names[index])
+                parts.append(b'::')
+                parts.append(device_data[index].encode())
+                parts.append(b'\n')
+            frame = self._full_state_frame = b''.join(parts)
+        return frame
+
+    def status_json(self) -> bytes:
+        """
+        {"<data_name>": [every item], "version": n} encoded as JSON.  rebuilt only when the
+        version changes, so any number of pollers of an unchanged device cost no serialization.
+        """
+        if self._status_json_version != self.version:
+            self._status_json = json.dumps({self.data_name: self.device_data, 'version': self.version}).encode('utf-8')
+            self._status_json_version = self.version
+        return self._status_json
+
+    def status_since_json(self, since: int) -> bytes:
+        """
+        {"changes": {"<index>": value, ...}, "version": n} with the items changed after version since.
+        the full status_json() is returned if since is not a version this device has reached.
+        """
+        version = self.version
+        if since <= 0 or since > version:
+            return self.status_json()
+        changes = {}
+        if since < version:
+            device_data = self.device_data
+            for index, changed in enumerate(self.change_versions):
+                if changed > since:
+                    changes[str(index)] = device_data[index]
+        return json.dumps({'changes': changes, 'version': version}).encode('utf-8')
+
+    def poll_health(self, now: int) -> dict:
+        return {'state': POLL_STATE_NAMES[self.poll_state],
+                'last_response_ms': ticks_diff(now, self.last_response_time) if self.last_response_time != 0 else None,
+                'polls': self.polls_sent,
+                'timeouts': self.poll_timeouts,
+                }
+
+    def write_full_state(self, client_data: ClientData, writer):
+        frame = self.full_state_frame()
+        writer.write(frame)
+        client_data.full_state_pending = False
+        client_data.bytes_sent += len(frame)
+        client_data.updates_sent += len(self.initial_update_order)
+
+    def updates_due(self, client_data: ClientData, now: int) -> bool:
+        """
+        true if this client has queued updates that should be sent now.
+        """
+        if len(client_data.update_list) == 0:
+            return False
+        if client_data.role == ROLE_OBSERVE and self.observer_update_ms > 0:
+            return ticks_diff(now, client_data.last_update) >= self.observer_update_ms
+        return True
+
+    async def wait_for_change(self, timeout: float) -> bool:
+        """
+        wait until any device_data item changes, or timeout seconds pass.
+        returns True if something changed.
+        """
+        event = self._change_event
+        if event is None:
+            event = self._change_event = asyncio.Event()
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except TimeoutError:
+            return False
+
+    def wake_waiters(self):
+        """
+        wake every task in wait_for_change without a change, so it sees that its client went away.
+        """
+        self._notify_change()
+
+    def _notify_change(self):
+        # wake every waiter.  the next waiter makes a new event, so nothing is allocated when nobody waits.
+        event = self._change_event
+        if event is not None:
+            self._change_event = None
+            event.set()
+
     def update_device_data(self, index, value):
         if self.device_data[index] != value:
             self.device_data[index] = value
-            for client in self.network_clients:
+            self.version += 1
+            self.change_versions[index] = self.version
+            self._full_state_frame = None
+            self._notify_change()
+            if self.status_publisher is not None:
+                self.status_publisher.field_changed(index)
+            for client in self.network_clients.snapshot():
+                if client.role == ROLE_NONE or client.full_state_pending:
+                    continue  # nothing to send, or the full state frame will carry this change.
                 if index not in client.update_set:
                     client.update_list.append(index)
                     client.update_set.add(index)
 
     async def device_send_receive(self, message, buf_and_length, timeout=5.0, retries=1):
+        self.polls_sent += 1
         retries_left = retries
         while retries_left > 0:
             retries_left -= 1
@@ -111,8 +353,9 @@ class KDevice:
                              'kdevice:device_send_receive')
                 else:
                     break
-            device_port.write(message)
-            device_port.flush()
+            with gc_manager.busy(polling=True):  # only the UART transfers, not the waits.
+                device_port.write(message)
+                device_port.flush()
             await asyncio.sleep(0.1)  # TODO FIXME
 
             while timeout > 0:
@@ -120,14 +363,17 @@ class KDevice:
                 timeout -= 0.01
                 if device_port.any() > 0:
                     break
-            buf_and_length.bytes_received = device_port.readinto(buf_and_length.buffer)
+            with gc_manager.busy(polling=True):
+                buf_and_length.bytes_received = device_port.readinto(buf_and_length.buffer)
             if buf_and_length.bytes_received > 0:
+                self.last_response_time = milliseconds()
                 return
             if retries_left > 0:
                 if logging.should_log(logging.DEBUG):
                     logging.debug(f'received {buf_and_length.bytes_received} bytes response to {message}, {retries_left} retries left.',
                                   'kdevice:device_send_receive')
             else:
+                self.poll_timeouts += 1
                 if logging.should_log(logging.DEBUG):
                     logging.debug(f'timeout waiting for response to "{message}".', 'kdevice:device_send_receive')
 
@@ -135,10 +381,12 @@ class KDevice:
     async def read_network_client(reader):
         try:
             data = await reader.readline()
+            if not data:
+                return b''  # end of stream, the client has closed the connection.
             return data.decode().strip()
         # except ConnectionResetError as cre:  # micropython does not support ConnectionResetError
         #    logging.warning(f'ConnectionResetError in read_network_client: {str(cre)}', 'read_network_client')
         except Exception as exc:
-            logging.exception(f'exception in read_network_client: {str(ex)}',
+            logging.exception(f'exception in read_network_client: {str(exc)}',
                               'kdevice:read_network_client', exc_info=exc)
         return None
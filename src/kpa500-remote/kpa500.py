@@ -22,15 +22,14 @@ LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
 OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
 OF THE POSSIBILITY OF SUCH DAMAGE.
 """
-__version__ = '0.9.4'  # 2026-07-09
+__version__ = '0.9.7'  # 2026-10-19
 
 # disable pylint import error
 # pylint: disable=E0401
 
 import asyncio
-import gc
 import micro_logging as logging
-from kdevice import KDevice, ClientData, BufferAndLength
+from kdevice import KDevice, BufferAndLength
 from utils import upython, milliseconds, safe_int
 
 
@@ -65,6 +64,11 @@ class KPA500(KDevice):
         b'amp::slider::PWR Meter Hold',  # 18 : integer
     )
 
+    data_name = 'kpa500_data'
+
+    # the order that items are sent to a newly connected client.
+    initial_update_order = (7, 16, 6, 0, 1, 2, 3, 4, 8, 5, 9, 10, 11, 12, 13, 14, 15, 17, 18)
+
     fault_texts = ('AMP ON',    # 0
                    '01',        # 1
                    'HI CURR',   # 2
@@ -233,6 +237,7 @@ class KPA500(KDevice):
         run_loop = True
 
         while run_loop:
+            self.poll_state = amp_state
             if amp_state == 0:  # unknown / no response state
                 # poke at the amplifier -- is it connected?
                 await self.device_send_receive(b';', bl)
@@ -332,9 +337,7 @@ class KPA500(KDevice):
         t0 = milliseconds()
         extra = writer.get_extra_info('peername')
         client_name = f'{extra[0]}:{extra[1]}'
-        client_data = ClientData(client_name)
-        client_data.update_list.extend((7, 16, 6, 0, 1, 2, 3, 4, 8, 5, 9, 10, 11, 12, 13, 14, 15, 17, 18))  # items to send.
-        self.network_clients.append(client_data)
+        client_data = self.add_network_client(writer, client_name)
         logging.info(f'client {client_name} connected', 'kpa500:serve_kpa500_remote_client')
         try:
             while client_data.connected:
@@ -364,8 +367,9 @@ class KPA500(KDevice):
                                        b'Remote control will not be allowed.\n'
                         else:
                             response = b'server::login::valid\n'
-                            client_data.authorized = True
+                            self.client_logged_in(client_data)
                         writer.write(response)
+                        client_data.bytes_sent += len(response)
                         client_data.last_activity = milliseconds()
                         logging.debug(f'sending "{response.decode().strip()}"', 'kpa500:serve_kpa500_remote_client')
                     else:
@@ -420,30 +424,37 @@ class KPA500(KDevice):
                         client_data.connected = False
 
                 # send any outstanding data back...
-                if len(client_data.update_list) > 0:
+                if client_data.full_state_pending:
+                    self.write_full_state(client_data, writer)
+                    await writer.drain()
+                    client_data.last_activity = client_data.last_update = milliseconds()
+                if self.updates_due(client_data, milliseconds()):
                     while len(client_data.update_list) > 0:
                         index = client_data.update_list.popleft()
                         client_data.update_set.discard(index)
                         try:
-                            writer.write(self.key_names[index])
+                            key_name = self.key_names[index]
+                            writer.write(key_name)
                             payload = f'::{self.device_data[index]}\n'.encode()
                             writer.write(payload)
+                            client_data.bytes_sent += len(key_name) + len(payload)
+                            client_data.updates_sent += 1
                         except (BrokenPipeError, ConnectionResetError):
                             client_data.connected = False
                             break
                         logging.debug(f'sent "{self.key_names[index].decode()}{payload.decode().strip()}"',
                                       'serve_kpa500_remote_client')
                     await writer.drain()
-                    client_data.last_activity = milliseconds()
+                    client_data.last_activity = client_data.last_update = milliseconds()
 
-                since_last_activity = milliseconds() - client_data.last_activity
-                if since_last_activity > 15000:
+                if client_data.keepalive_due:
+                    client_data.keepalive_due = False
                     writer.write(b'\n')
+                    client_data.bytes_sent += 1
                     await writer.drain()
                     client_data.last_activity = milliseconds()
                     logging.debug(f'SENT keepalive TO client {client_name}',
                                  'kpa500:serve_kpa500_remote_client')
-                    gc.collect()
 
             # connection closing
             logging.info(f'client {client_name} connection closing...', 'serve_kpa500_remote_client')
@@ -456,15 +467,10 @@ class KPA500(KDevice):
             raise ex
         finally:
             logging.info(f'client {client_name} disconnected', 'serve_kpa500_remote_client')
-            found_network_client = None
-            for network_client in self.network_clients:
-                if network_client.client_name == client_data.client_name:
-                    found_network_client = network_client
-                    break
-            if found_network_client is not None:
-                self.network_clients.remove(found_network_client)
+            if self.remove_network_client(writer) is not None:
                 logging.info(f'client {client_name} removed from network_clients list.',
                              'kpa500:serve_kpa500_remote_client')
         tc = milliseconds()
-        logging.info(f'client {client_name} disconnected, elapsed time {((tc - t0) / 1000.0):6.3f} seconds',
+        logging.info(f'client {client_name} disconnected, elapsed time {((tc - t0) / 1000.0):6.3f} seconds, '
+                     f'{client_data.updates_sent} updates, {client_data.bytes_sent} bytes sent',
                      'kpa500:serve_kpa500_remote_client')
@@ -3,7 +3,7 @@
 #
 __author__ = 'J. B. Otterson'
 __copyright__ = 'Copyright 2023, 2024, 2025, 2026 J. B. Otterson N1KDO.'
-__version__ = '0.9.8'  # 2026-05-28
+__version__ = '0.9.25'  # 2026-10-19
 
 #
 # Copyright 2023, 2024, 2025, 2026 J. B. Otterson N1KDO.
@@ -36,14 +36,23 @@ import json
 
 from http_server import (HttpServer,
                          HTTP_STATUS_OK, HTTP_STATUS_BAD_REQUEST, HTTP_STATUS_MOVED_PERMANENTLY,
-                         HTTP_VERB_GET, HTTP_VERB_POST)
+                         HTTP_STATUS_SWITCHING_PROTOCOLS, HTTP_STATUS_UNAUTHORIZED, HTTP_STATUS_LENGTH_REQUIRED,
+                         HTTP_STATUS_INTERNAL_SERVER_ERROR, HTTP_STATUS_REQUEST_TIMEOUT,
+                         HTTP_VERB_GET, HTTP_VERB_POST, QUEUE_REJECT, QUEUE_WAIT,
+                         arg_bool, arg_enum, arg_int, arg_ipv4, arg_str, basic_credentials, validate_args)
+from config_store import ConfigStore
+from gc_manager import gc_manager
+from kdevice import ROLE_NAMES, ROLE_NONE, ROLE_OBSERVE, keepalive_timer
 from kpa500 import KPA500
 from kat500 import KAT500
 from morse_code import MorseCode
-from utils import upython, safe_int
+import ota
+from status_publisher import StatusPublisher
+from utils import upython, milliseconds, safe_int, ticks_add, ticks_diff
 import micro_logging as logging
 
 if upython:
+    from asyncio import TimeoutError
     import machine
     from picow_network import PicowNetwork
     try:
@@ -51,6 +60,7 @@ if upython:
     except ImportError:
         Watchdog = None
 else:
+    from asyncio.exceptions import TimeoutError
     from not_machine import machine
     import sys
     Watchdog = None
@@ -68,47 +78,53 @@ DEFAULT_SSID = 'kpa500'
 DEFAULT_KPA500_TCP_PORT = 4626
 DEFAULT_KAT500_TCP_PORT = 4627
 DEFAULT_WEB_PORT = 80
+DEFAULT_UNAUTHENTICATED_ROLE = 'observe'
+DEFAULT_OBSERVER_UPDATE_MS = 0
+DEFAULT_UDP_STATUS_ADDRESS = '255.255.255.255'
+DEFAULT_UDP_STATUS_PORT = 0  # disabled
+DEFAULT_WEB_MAX_CONNECTIONS = 6
+DEFAULT_WEB_QUEUE_POLICY = 'wait'  # or 'reject'
+
+MAX_LONG_POLL_MS = 30000  # longest a status request can wait for a change.
+SSE_KEEPALIVE = b': keepalive\n\n'  # an event stream comment line, EventSource ignores it.
 
 # globals...
 keep_running = True
 kpa500 = None
 kat500 = None
+listeners = {}  # service name -> (asyncio server, port), so a service can move to a new port.
 
 # http server
 http_server = HttpServer(content_dir=CONTENT_DIR)
 
-
-def read_config():
-    try:
-        with open(CONFIG_FILE, 'r') as config_file:
-            config = json.load(config_file)
-    except Exception as exc:
-        logging.exception(f'failed to load configuration!', 'main:read_config', exc_info=exc)
-        config = {
-            'SSID': DEFAULT_SSID,
-            'secret': DEFAULT_SECRET,
-            'username': 'admin',
-            'password': 'admin',
-            'dhcp': True,
-            'hostname': 'kpa500',
-            'ip_address': '192.168.1.73',
-            'netmask': '255.255.255.0',
-            'gateway': '192.168.1.1',
-            'dns_server': '8.8.8.8',
-            'kpa_tcp_port': DEFAULT_KPA500_TCP_PORT,
-            'kat_tcp_port': DEFAULT_KAT500_TCP_PORT,
-            'web_port': DEFAULT_WEB_PORT,
-        }
-    return config
-
-
-def save_config(config):
-    with open(CONFIG_FILE, 'w') as config_file:
-        json.dump(config, config_file)
+# configuration field -> (schema entry, default value)
+CONFIG_SCHEMA = {
+    'SSID': (arg_str(1, 64), DEFAULT_SSID),
+    'secret': (arg_str(8, 32), DEFAULT_SECRET),
+    'username': (arg_str(1, 16), 'admin'),
+    'password': (arg_str(1, 16), 'admin'),
+    'ap_mode': (arg_bool(), False),
+    'dhcp': (arg_bool(), True),
+    'hostname': (arg_str(1, 16), 'kpa500'),
+    'ip_address': (arg_str(0, 15), '192.168.1.73'),
+    'netmask': (arg_str(0, 15), '255.255.255.0'),
+    'gateway': (arg_str(0, 15), '192.168.1.1'),
+    'dns_server': (arg_str(0, 15), '8.8.8.8'),
+    'kpa_tcp_port': (arg_int(0, 65535), DEFAULT_KPA500_TCP_PORT),
+    'kat_tcp_port': (arg_int(0, 65535), DEFAULT_KAT500_TCP_PORT),
+    'web_port': (arg_int(0, 65535), DEFAULT_WEB_PORT),
+    'unauthenticated_role': (arg_enum((ROLE_NAMES[ROLE_NONE], ROLE_NAMES[ROLE_OBSERVE])), DEFAULT_UNAUTHENTICATED_ROLE),
+    'observer_update_ms': (arg_int(0, 60000), DEFAULT_OBSERVER_UPDATE_MS),
+    'udp_status_address': (arg_ipv4(), DEFAULT_UDP_STATUS_ADDRESS),
+    'udp_status_port': (arg_int(0, 65535), DEFAULT_UDP_STATUS_PORT),
+    'web_max_connections': (arg_int(1, 16), DEFAULT_WEB_MAX_CONNECTIONS),
+    'web_queue_policy': (arg_enum(('wait', 'reject')), DEFAULT_WEB_QUEUE_POLICY),
+}
+config = ConfigStore(CONFIG_FILE, CONFIG_SCHEMA)
 
 
 # noinspection PyUnusedLocal
-@http_server.route(b'/')
+@http_server.route(b'/', verbs=(HTTP_VERB_GET,))
 async def slash_callback(http, verb, args, reader, writer, request_headers=None):  # callback for '/'
     http_status = HTTP_STATUS_MOVED_PERMANENTLY
     bytes_sent = await http.send_simple_response(writer, http_status, None, None, [b'Location: /kpa500.html'])
@@ -119,104 +135,25 @@ async def slash_callback(http, verb, args, reader, writer, request_headers=None)
 @http_server.route(b'/api/config')
 async def api_config_callback(http, verb, args, reader, writer, request_headers=None):  # callback for '/api/config'
     if verb == HTTP_VERB_GET:
-        payload = read_config()
+        payload = config.as_dict()
         payload.pop('secret')  # do not return the secret
         response = json.dumps(payload).encode('utf-8')
         http_status = HTTP_STATUS_OK
         bytes_sent = await http.send_simple_response(writer, http_status, http.CT_APP_JSON, response)
     elif verb == HTTP_VERB_POST:
-        config = read_config()
-        dirty = False
-        errors = []
-        kat_tcp_port = args.get('kat_tcp_port')
-        if kat_tcp_port is not None:
-            kat_tcp_port_int = safe_int(kat_tcp_port, -2)
-            if 0 <= kat_tcp_port_int <= 65535:
-                config['kat_tcp_port'] = kat_tcp_port_int
-                dirty = True
-            else:
-                errors.append('kat_tcp_port')
-        kpa_tcp_port = args.get('kpa_tcp_port')
-        if kpa_tcp_port is not None:
-            kpa_tcp_port_int = safe_int(kpa_tcp_port, -2)
-            if 0 <= kpa_tcp_port_int <= 65535:
-                config['kpa_tcp_port'] = kpa_tcp_port_int
-                dirty = True
-            else:
-                errors.append('kpa_tcp_port')
-        web_port = args.get('web_port')
-        if web_port is not None:
-            web_port_int = safe_int(web_port, -2)
-            if 0 <= web_port_int <= 65535:
-                config['web_port'] = web_port_int
-                dirty = True
-            else:
-                errors.append('web_port')
-        ssid = args.get('SSID')
-        if ssid is not None:
-            if 0 < len(ssid) <= 64:
-                config['SSID'] = ssid
-                dirty = True
-            else:
-                errors.append('SSID')
-        secret = args.get('secret')
-        if secret is not None and len(secret):
-            if 8 <= len(secret) <= 32:
-                config['secret'] = secret
-                dirty = True
-            else:
-                errors.append('secret')
-        remote_username = args.get('username')
-        if remote_username is not None:
-            if 1 <= len(remote_username) <= 16:
-                config['username'] = remote_username
-                dirty = True
-            else:
-                errors.append('username')
-        remote_password = args.get('password')
-        if remote_password is not None:
-            if 1 <= len(remote_password) <= 16:
-                config['password'] = remote_password
-                dirty = True
-            else:
-                errors.append('password')
-        ap_mode_arg = args.get('ap_mode')
-        if ap_mode_arg is not None:
-            ap_mode = ap_mode_arg == '1'
-            config['ap_mode'] = ap_mode
-            dirty = True
-        dhcp_arg = args.get('dhcp')
-        if dhcp_arg is not None:
-            dhcp = dhcp_arg == '1'
-            config['dhcp'] = dhcp
-            dirty = True
-        hostname = args.get('hostname')
-        if hostname is not None:
-            if 1 <= len(hostname) <= 16:
-                config['hostname'] = hostname
-                dirty = True
-            else:
-                errors.append('hostname')
-        ip_address = args.get('ip_address')
-        if ip_address is not None:
-            config['ip_address'] = ip_address
-            dirty = True
-        netmask = args.get('netmask')
-        if netmask is not None:
-            config['netmask'] = netmask
-            dirty = True
-        gateway = args.get('gateway')
-        if gateway is not None:
-            config['gateway'] = gateway
-            dirty = True
-        dns_server = args.get('dns_server')
-        if dns_server is not None:
-            config['dns_server'] = dns_server
-            dirty = True
+        changes = {}
+        for name in CONFIG_SCHEMA:
+            value = args.get(name)
+            if value is not None:
+                changes[name] = value
+        if changes.get('secret') == '':  # an empty secret keeps the old one.
+            del changes['secret']
+        errors = await config.update(changes)  # the file is written a little later, and only if something changed.
         if not errors:
-            if dirty:
-                save_config(config)
-            response = b'ok\r\n'
+            if config.restart_pending:
+                response = f'ok, restart to apply {", ".join(sorted(config.restart_pending))}\r\n'.encode('utf-8')
+            else:
+                response = b'ok\r\n'
             http_status = HTTP_STATUS_OK
             bytes_sent = await http.send_simple_response(writer, http_status, http.CT_TEXT_TEXT, response)
         else:
@@ -246,236 +183,514 @@ async def api_restart_callback(http, verb, args, reader, writer, request_headers
     return bytes_sent, http_status
 
 
-# KPA500 specific APIs
 # noinspection PyUnusedLocal
-@http_server.route(b'/api/kpa_clear_fault')
-async def api_kpa_clear_fault_callback(http, verb, args, reader, writer, request_headers=None):
-    kpa500.enqueue_command(b'^FLC;')
-    response = b'ok\r\n'
+@http_server.route(b'/api/inventory', verbs=(HTTP_VERB_GET,))
+async def api_inventory_callback(http, verb, args, reader, writer, request_headers=None):
+    """
+    path, size, and sha1 of every application file, so an updater can bundle only the files that changed.
+    """
     http_status = HTTP_STATUS_OK
-    bytes_sent = await http.send_simple_response(writer, http_status, http.CT_TEXT_TEXT, response)
+    bytes_sent = await http.send_simple_response(writer, http_status, http.CT_APP_JSON, await ota.inventory(http))
     return bytes_sent, http_status
 
 
 # noinspection PyUnusedLocal
-@http_server.route(b'/api/kpa_set_band')
-async def api_kpa_set_band_callback(http, verb, args, reader, writer, request_headers=None):
-    band_name = args.get('band')
-    band_number = kpa500.band_label_to_number(band_name)
-    if band_number is not None:
-        command = f'^BN{band_number:02d};'.encode()
-        kpa500.enqueue_command(command)
-        response = b'ok\r\n'
+@http_server.route(b'/api/ota_bundle', verbs=(HTTP_VERB_POST,), args={'restart': arg_enum(('0', '1'), False)},
+                   long_lived=True)
+async def api_ota_bundle_callback(http, verb, args, reader, writer, request_headers=None):
+    """
+    apply an update bundle, see ota.py.  needs the configured username and password as Basic auth.
+    with ?restart=1 the device restarts afterwards if any python file was replaced.
+    long lived because a full bundle over Wi-Fi can take longer than the response deadline,
+    but each read of the body still times out.
+    """
+    global keep_running
+    credentials = basic_credentials(request_headers)
+    if credentials is None or credentials != (config.get('username'), config.get('password')):
+        http_status = HTTP_STATUS_UNAUTHORIZED
+        bytes_sent = await http.send_simple_response(writer, http_status, http.CT_TEXT_TEXT,
+                                                     b'authorization required\r\n',
+                                                     [b'WWW-Authenticate: Basic realm="kpa500"'])
+        return bytes_sent, http_status
+    content_length = safe_int(request_headers.get(b'content-length'), -1)
+    if content_length <= 0:
+        http_status = HTTP_STATUS_LENGTH_REQUIRED
+        bytes_sent = await http.send_simple_response(writer, http_status, http.CT_TEXT_TEXT, b'no bundle\r\n')
+        return bytes_sent, http_status
+    reader.timeout = http.body_timeout
+    result = None
+    try:
+        async with http.buffer_lock:
+            result = await ota.receive_bundle(http, reader, content_length)
         http_status = HTTP_STATUS_OK
-    else:
-        response = b'bad band name parameter\r\n'
-        http_status = HTTP_STATUS_BAD_REQUEST
+        response = result
+    except ota.BundleError as be:
+        logging.warning(f'bundle rejected: {be.message}', 'main:api_ota_bundle_callback')
+        http_status = be.http_status
+        response = (be.message + '\r\n').encode()
+    except TimeoutError:  # before OSError, CPython's TimeoutError is one.  the staged files are already gone.
+        logging.warning('bundle body timed out', 'main:api_ota_bundle_callback')
+        http.body_timeouts += 1
+        http_status = HTTP_STATUS_REQUEST_TIMEOUT
+        response = b'bundle timed out\r\n'
+    except OSError as ose:
+        logging.error(f'bundle failed: {ose}', 'main:api_ota_bundle_callback')
+        http_status = HTTP_STATUS_INTERNAL_SERVER_ERROR
+        response = f'bundle failed: {ose}\r\n'.encode()
     bytes_sent = await http.send_simple_response(writer, http_status, http.CT_TEXT_TEXT, response)
+    if result is not None and result['restart'] and args.get('restart') == '1' and upython:
+        keep_running = False
     return bytes_sent, http_status
 
 
-# noinspection PyUnusedLocal
-@http_server.route(b'/api/kpa_set_fan_speed')
-async def api_kpa_set_fan_speed_callback(http, verb, args, reader, writer, request_headers=None):
-    speed = safe_int(args.get('speed'), -1)
-    if 0 <= speed <= 6:
-        command = f'^FC{speed};^FC;'.encode()
-        kpa500.enqueue_command(command)
-        response = b'ok\r\n'
-        http_status = HTTP_STATUS_OK
-    else:
-        response = b'bad fan speed parameter\r\n'
-        http_status = HTTP_STATUS_BAD_REQUEST
-    bytes_sent = await http.send_simple_response(writer, http_status, http.CT_TEXT_TEXT, response)
-    return bytes_sent, http_status
+async def next_device_delta(device, client_data):
+    """
+    wait until something should be sent to a streaming client.  returns a dict of the changed items
+    keyed by str(index), or None when a keepalive is due or the client has disconnected.
+    """
+    while client_data.connected:
+        now = milliseconds()  # updates can be waiting already, check before waiting for the next change.
+        if device.updates_due(client_data, now):
+            delta = {}
+            device_data = device.device_data
+            update_list = client_data.update_list
+            while len(update_list) > 0:
+                index = update_list.popleft()
+                client_data.update_set.discard(index)
+                delta[str(index)] = device_data[index]
+            client_data.updates_sent += len(delta)
+            client_data.last_update = now
+            client_data.last_activity = now
+            return delta
+        if len(client_data.update_list) > 0:  # observer rate limit, wait until the updates are due.
+            # a change wakes this early, that only costs another check, but a disconnect is seen at once.
+            await device.wait_for_change((device.observer_update_ms - ticks_diff(now, client_data.last_update)) / 1000.0)
+        elif client_data.keepalive_due:
+            client_data.keepalive_due = False
+            client_data.last_activity = now
+            return None
+        else:
+            await device.wait_for_change(1.0)
+    return None
 
 
-# noinspection PyUnusedLocal
-@http_server.route(b'/api/kpa_set_operate')
-async def api_kpa_set_operate_callback(http, verb, args, reader, writer, request_headers=None):
-    state = args.get('state')
-    if state in ('0', '1'):
-        command = f'^OS{state};^OS;'.encode()
-        kpa500.enqueue_command(command)
-        response = b'ok\r\n'
-        http_status = HTTP_STATUS_OK
-    else:
-        response = b'bad state parameter\r\n'
-        http_status = HTTP_STATUS_BAD_REQUEST
-    bytes_sent = await http.send_simple_response(writer, http_status, http.CT_TEXT_TEXT, response)
-    return bytes_sent, http_status
+async def watch_for_close(reader, device, client_data):
+    """
+    an event stream client never sends anything, so a read that returns nothing means it has gone.
+    """
+    try:
+        while len(await reader.read(64)) > 0:  # ignore anything the client does send.
+            pass
+    except OSError:
+        pass
+    finally:
+        client_data.connected = False
+        device.wake_waiters()
+
+
+async def serve_device_events(http, reader, writer, device, data_name):
+    """
+    stream device_data as Server-Sent Events: one 'state' event with every item, then 'delta' events
+    with only the items that changed, driven by the device's change notifications.
+    """
+    peer = writer.get_extra_info('peername')
+    client_data = device.add_network_client(writer, f'{peer[0]}:{peer[1]} events', ROLE_OBSERVE)
+    watcher = asyncio.create_task(watch_for_close(reader, device, client_data))
+    bytes_sent = 0
+    try:
+        await http.start_response(writer, HTTP_STATUS_OK, http.CT_TEXT_EVENT_STREAM, -1, [b'Cache-Control: no-cache'])
+        # changes are not queued while the full state is pending, so take the snapshot and clear the flag together.
+        client_data.full_state_pending = False
+        payload = json.dumps({data_name: device.device_data}).encode('utf-8')
+        bytes_sent += http.write_event(writer, b'state', payload)
+        await writer.drain()
+        while client_data.connected:
+            delta = await next_device_delta(device, client_data)
+            if delta is not None:
+                bytes_sent += http.write_event(writer, b'delta', json.dumps(delta).encode('utf-8'))
+            elif client_data.connected:
+                writer.write(SSE_KEEPALIVE)
+                bytes_sent += len(SSE_KEEPALIVE)
+            client_data.bytes_sent = bytes_sent
+            await writer.drain()
+    except OSError as ose:
+        logging.info(f'events client {client_data.client_name} disconnected: {ose}', 'main:serve_device_events')
+    finally:
+        watcher.cancel()
+        device.remove_network_client(writer)
+    return bytes_sent, HTTP_STATUS_OK
 
 
-# noinspection PyUnusedLocal
-@http_server.route(b'/api/kpa_set_power')
-async def api_kpa_set_power_callback(http, verb, args, reader, writer, request_headers=None):
-    state = args.get('state')
-    if state in ('0', '1'):
-        command = f'^ON{state};'.encode()
-        kpa500.enqueue_command(command)
-        response = b'ok\r\n'
-        http_status = HTTP_STATUS_OK
-    else:
-        response = b'bad state parameter\r\n'
-        http_status = HTTP_STATUS_BAD_REQUEST
-    bytes_sent = await http.send_simple_response(writer, http_status, http.CT_TEXT_TEXT, response)
-    return bytes_sent, http_status
+#
+# device commands.  the same table serves the /api/<command name> routes and commands sent over the WebSocket.
+# the arguments are checked against the schema before the builder is called, so builders can trust them.
+#
+def constant_command(command):
+    # noinspection PyUnusedLocal
+    def builder(args):
+        return command
+    return builder
+
+
+def state_command(off_command, on_command):
+    def builder(args):
+        return on_command if args['state'] == '1' else off_command
+    return builder
+
+
+def kpa_set_band_command(args):
+    return f'^BN{kpa500.band_label_to_number(args["band"]):02d};'.encode()
+
+
+def kpa_set_fan_speed_command(args):
+    return f'^FC{safe_int(args["speed"])};^FC;'.encode()
+
+
+def kat_set_antenna_command(args):
+    return f'AN{args["antenna"]};AN;'.encode()
+
+
+def kat_set_mode_command(args):
+    return f'MD{args["mode"]};MD;'.encode()
+
+
+STATE_ARGS = {'state': arg_enum(('0', '1'))}
+
+# command name -> (device name, argument schema, command builder)
+DEVICE_COMMANDS = {
+    'kpa_clear_fault': ('kpa', None, constant_command(b'^FLC;')),
+    'kpa_set_band': ('kpa', {'band': arg_enum(KPA500.band_number_to_name)}, kpa_set_band_command),
+    'kpa_set_fan_speed': ('kpa', {'speed': arg_int(0, 6)}, kpa_set_fan_speed_command),
+    'kpa_set_operate': ('kpa', STATE_ARGS, state_command(b'^OS0;^OS;', b'^OS1;^OS;')),
+    'kpa_set_power': ('kpa', STATE_ARGS, state_command(b'^ON0;', b'^ON1;')),
+    'kpa_set_speaker_alarm': ('kpa', STATE_ARGS, state_command(b'^SP0;^SP;', b'^SP1;^SP;')),
+    'kat_clear_fault': ('kat', None, constant_command(b'FLTC;FLT;')),
+    'kat_set_ampi': ('kat', STATE_ARGS, state_command(b'AMPI0;AMPI;', b'AMPI1;AMPI;')),
+    'kat_set_antenna': ('kat', {'antenna': arg_enum(('0', '1', '2', '3'))}, kat_set_antenna_command),
+    'kat_set_attn': ('kat', STATE_ARGS, state_command(b'ATTN0;ATTN;', b'ATTN1;ATTN;')),
+    'kat_set_bypass': ('kat', STATE_ARGS, state_command(b'BYPN;BYP;', b'BYPB;BYP;')),
+    'kat_set_mode': ('kat', {'mode': arg_enum(('A', 'M', 'B'))}, kat_set_mode_command),
+    'kat_set_power': ('kat', STATE_ARGS, state_command(b'PS0;PS;', b'PS1;PS;')),
+    'kat_set_tune': ('kat', STATE_ARGS, state_command(b'CT;TP;', b'FT;TP;')),
+}
+
+CANNED_OK = http_server.canned_response(HTTP_STATUS_OK, HttpServer.CT_TEXT_TEXT, b'ok\r\n')
+
+
+def get_device(device_name):
+    if device_name == 'kpa':
+        return kpa500
+    if device_name == 'kat':
+        return kat500
+    return None
+
+
+def run_device_command(command_name, args):
+    """
+    validate and enqueue a device command.  returns None on success, else an error message.
+    """
+    entry = DEVICE_COMMANDS.get(command_name)
+    if entry is None:
+        return b'unknown command'
+    device_name, schema, builder = entry
+    bad_arg = validate_args(schema, args)
+    if bad_arg is not None:
+        return b'bad %s parameter' % bad_arg.encode()
+    device = get_device(device_name)
+    if device is None:
+        return b'device is not enabled'
+    device.enqueue_command(builder(args))
+    return None
+
+
+def device_command_callback(device_name, builder):
+    """
+    make the http route callback for one device command.  the server has already checked the arguments.
+    """
+    # noinspection PyUnusedLocal
+    async def callback(http, verb, args, reader, writer, request_headers=None):
+        device = get_device(device_name)
+        if device is None:
+            http_status = HTTP_STATUS_BAD_REQUEST
+            bytes_sent = await http.send_simple_response(writer, http_status, http.CT_TEXT_TEXT,
+                                                         b'device is not enabled\r\n')
+            return bytes_sent, http_status
+        device.enqueue_command(builder(args))
+        return await http.send_canned_response(writer, CANNED_OK)
+    return callback
+
+
+for _command_name, (_device_name, _schema, _builder) in DEVICE_COMMANDS.items():
+    http_server.route(b'/api/' + _command_name.encode(), args=_schema)(device_command_callback(_device_name, _builder))
+
+
+# a since that is not a version number is not an error, it gets the full status body.
+STATUS_ARGS = {'since': arg_str(0, 16, False), 'wait': arg_int(0, MAX_LONG_POLL_MS, False)}
+
+
+async def device_status_json(device, args):
+    """
+    the status response body.  with since=<version>, only the items changed after that version.
+    with wait=<ms> as well, a request that would get no changes is held until an item changes
+    or wait ms pass (long poll), woken by the same change notification the event streams use.
+    """
+    since = safe_int(args.get('since'), -1)
+    if since < 0:
+        return device.status_json()
+    wait_ms = safe_int(args.get('wait'), 0)
+    if wait_ms > 0 and since == device.version:
+        deadline = ticks_add(milliseconds(), wait_ms)
+        while device.version == since:
+            remaining = ticks_diff(deadline, milliseconds())
+            if remaining <= 0:
+                break
+            await device.wait_for_change(remaining / 1000.0)
+    return device.status_since_json(since)
 
 
 # noinspection PyUnusedLocal
-@http_server.route(b'/api/kpa_set_speaker_alarm')
-async def api_kpa_set_speaker_alarm_callback(http, verb, args, reader, writer, request_headers=None):
-    state = args.get('state')
-    if state in ('0', '1'):
-        command = f'^SP{state};^SP;'.encode()
-        kpa500.enqueue_command(command)
-        response = b'ok\r\n'
-        http_status = HTTP_STATUS_OK
+@http_server.route(b'/api/status', verbs=(HTTP_VERB_GET,),
+                   args={'kpa': arg_str(0, 64, False), 'kat': arg_str(0, 64, False)})
+async def api_status_callback(http, verb, args, reader, writer, request_headers=None):  # '/api/status'
+    """
+    every enabled device in one response, with its version and polling health, and the web server counters.
+    ?kpa=10,11&kat=13 returns only the listed items, keyed by index, of only the listed devices.
+    """
+    filtered = 'kpa' in args or 'kat' in args
+    now = milliseconds()
+    payload = {}
+    http_status = HTTP_STATUS_OK
+    for name, device_name, device in (('kpa500', 'kpa', kpa500), ('kat500', 'kat', kat500)):
+        if device is None or (filtered and device_name not in args):
+            continue
+        device_data = device.device_data
+        if filtered:
+            data = {}
+            for index_s in args[device_name].split(','):
+                if index_s == '':
+                    continue
+                index = safe_int(index_s, -1)
+                if not 0 <= index < len(device_data):
+                    http_status = HTTP_STATUS_BAD_REQUEST
+                    break
+                data[index_s] = device_data[index]
+        else:
+            data = device_data
+        payload[name] = {'data': data, 'version': device.version, 'poll': device.poll_health(now)}
+    if not filtered:
+        payload['http'] = http.stats()
+        payload['gc'] = gc_manager.stats()
+    if http_status == HTTP_STATUS_OK:
+        bytes_sent = await http.send_simple_response(writer, http_status, http.CT_APP_JSON, payload)
     else:
-        response = b'bad state parameter\r\n'
-        http_status = HTTP_STATUS_BAD_REQUEST
-    bytes_sent = await http.send_simple_response(writer, http_status, http.CT_TEXT_TEXT, response)
+        bytes_sent = await http.send_simple_response(writer, http_status, http.CT_TEXT_TEXT, b'bad field index\r\n')
     return bytes_sent, http_status
 
 
+# KPA500 specific APIs
 # noinspection PyUnusedLocal
-@http_server.route(b'/api/kpa_status')
+@http_server.route(b'/api/kpa_status', verbs=(HTTP_VERB_GET,), args=STATUS_ARGS, long_lived=True)
 async def api_kpa_status_callback(http, verb, args, reader, writer, request_headers=None):  # '/api/kpa_status'
-    payload = {'kpa500_data': kpa500.device_data}
-    response = json.dumps(payload).encode('utf-8')
+    response = await device_status_json(kpa500, args)
     http_status = HTTP_STATUS_OK
     bytes_sent = await http.send_simple_response(writer, http_status, http.CT_APP_JSON, response)
     return bytes_sent, http_status
 
 
+# noinspection PyUnusedLocal
+@http_server.route(b'/api/kpa_events', verbs=(HTTP_VERB_GET,), long_lived=True)
+async def api_kpa_events_callback(http, verb, args, reader, writer, request_headers=None):  # '/api/kpa_events'
+    return await serve_device_events(http, reader, writer, kpa500, 'kpa500_data')
+
+
 # KAT500 specific APIs
 # noinspection PyUnusedLocal
-@http_server.route(b'/api/kat_status')
+@http_server.route(b'/api/kat_events', verbs=(HTTP_VERB_GET,), long_lived=True)
+async def api_kat_events_callback(http, verb, args, reader, writer, request_headers=None):  # '/api/kat_events'
+    return await serve_device_events(http, reader, writer, kat500, 'kat500_data')
+
+
+# noinspection PyUnusedLocal
+@http_server.route(b'/api/kat_status', verbs=(HTTP_VERB_GET,), args=STATUS_ARGS, long_lived=True)
 async def api_kat_status_callback(http, verb, args, reader, writer, request_headers=None):  # '/api/kat_status'
-    payload = {'kat500_data': kat500.device_data}
-    response = json.dumps(payload).encode('utf-8')
+    response = await device_status_json(kat500, args)
     http_status = HTTP_STATUS_OK
     bytes_sent = await http.send_simple_response(writer, http_status, http.CT_APP_JSON, response)
     return bytes_sent, http_status
 
-@http_server.route(b'/api/kat_set_power')
-async def api_kat_set_power_callback(http, verb, args, reader, writer, request_headers=None):
-    state = args.get('state')
-    if state in ('0', '1'):
-        command = f'PS{state};PS;'.encode()
-        kat500.enqueue_command(command)
-        response = b'ok\r\n'
-        http_status = HTTP_STATUS_OK
-    else:
-        response = b'bad state parameter\r\n'
-        http_status = HTTP_STATUS_BAD_REQUEST
-    bytes_sent = await http.send_simple_response(writer, http_status, http.CT_TEXT_TEXT, response)
-    return bytes_sent, http_status
-
 
-@http_server.route(b'/api/kat_set_antenna')
-async def api_kat_set_antenna_callback(http, verb, args, reader, writer, request_headers=None):
-    antenna = args.get('antenna')
-    if antenna in ('0', '1', '2', '3'):
-        command = f'AN{antenna};AN;'.encode()
-        kat500.enqueue_command(command)
-        response = b'ok\r\n'
-        http_status = HTTP_STATUS_OK
-    else:
-        response = b'bad antenna parameter\r\n'
-        http_status = HTTP_STATUS_BAD_REQUEST
-    bytes_sent = await http.send_simple_response(writer, http_status, http.CT_TEXT_TEXT, response)
-    return bytes_sent, http_status
+#
+# WebSocket: one connection carries state, deltas, commands, and command acks.
+#   server -> client: {"s": [every item]}, then {"d": {"<index>": "<value>", ...}} as items change,
+#                     {"a": <id>, "ok": true} or {"a": <id>, "ok": false, "e": "<error>"} for each command.
+#   client -> server: {"i": <id>, "c": "<command name>", <command arguments>...}, e.g.
+#                     {"i": 7, "c": "kpa_set_operate", "state": "1"}
+#
+async def receive_websocket_commands(ws, device, client_data):
+    try:
+        while True:
+            message = await ws.receive()
+            if message is None:
+                break
+            try:
+                request = json.loads(message)
+                command_name = request.get('c')
+            except (ValueError, AttributeError):
+                await ws.send(b'{"a": null, "ok": false, "e": "bad message"}')
+                continue
+            error_message = run_device_command(command_name, request)
+            if error_message is None:
+                ack = {'a': request.get('i'), 'ok': True}
+            else:
+                ack = {'a': request.get('i'), 'ok': False, 'e': error_message.decode()}
+            await ws.send(json.dumps(ack).encode('utf-8'))
+    except (EOFError, OSError) as exc:
+        if logging.should_log(logging.DEBUG):
+            logging.debug(f'websocket client {client_data.client_name} lost: {exc}', 'main:receive_websocket_commands')
+    finally:
+        client_data.connected = False
+        device.wake_waiters()
 
 
-@http_server.route(b'/api/kat_set_mode')
-async def api_kat_set_mode_callback(http, verb, args, reader, writer, request_headers=None):
-    mode = args.get('mode')
-    if mode in ('A', 'M', 'B'):
-        command = f'MD{mode};MD;'.encode()
-        kat500.enqueue_command(command)
-        response = b'ok\r\n'
-        http_status = HTTP_STATUS_OK
-    else:
-        response = b'bad mode parameter\r\n'
+# noinspection PyUnusedLocal
+@http_server.route(b'/api/ws', verbs=(HTTP_VERB_GET,), args={'device': arg_enum(('kpa', 'kat'), False)},
+                   long_lived=True)
+async def api_ws_callback(http, verb, args, reader, writer, request_headers=None):  # '/api/ws?device=kpa|kat'
+    device = get_device(args.get('device', 'kpa'))
+    if device is None:
         http_status = HTTP_STATUS_BAD_REQUEST
-    bytes_sent = await http.send_simple_response(writer, http_status, http.CT_TEXT_TEXT, response)
-    return bytes_sent, http_status
-
-
-@http_server.route(b'/api/kat_set_tune')
-async def api_kat_set_tune_callback(http, verb, args, reader, writer, request_headers=None):
-    state = args.get('state')
-    if state in ('0', '1'):
-        if state == '1':
-            command = b'FT;TP;'
-        else:
-            command = b'CT;TP;'
-        kat500.enqueue_command(command)
-        response = b'ok\r\n'
-        http_status = HTTP_STATUS_OK
-    else:
-        response = b'bad state parameter\r\n'
+        bytes_sent = await http.send_simple_response(writer, http_status, http.CT_TEXT_TEXT, b'bad device parameter\r\n')
+        return bytes_sent, http_status
+    ws = await http.accept_websocket(reader, writer, request_headers)
+    if ws is None:
         http_status = HTTP_STATUS_BAD_REQUEST
-    bytes_sent = await http.send_simple_response(writer, http_status, http.CT_TEXT_TEXT, response)
-    return bytes_sent, http_status
-
-
-@http_server.route(b'/api/kat_clear_fault')
-async def api_kat_clear_fault_callback(http, verb, args, reader, writer, request_headers=None):
-    kat500.enqueue_command(b'FLTC;FLT;')
-    response = b'ok\r\n'
-    http_status = HTTP_STATUS_OK
-    bytes_sent = await http.send_simple_response(writer, http_status, http.CT_TEXT_TEXT, response)
-    return bytes_sent, http_status
-
-
-@http_server.route(b'/api/kat_set_ampi')
-async def api_kat_set_ampi_callback(http, verb, args, reader, writer, request_headers=None):
-    state = args.get('state')
-    if state in ('0', '1'):
-        command = f'AMPI{state};AMPI;'.encode()
-        kat500.enqueue_command(command)
-        response = b'ok\r\n'
-        http_status = HTTP_STATUS_OK
+        bytes_sent = await http.send_simple_response(writer, http_status, http.CT_TEXT_TEXT, b'websocket upgrade required\r\n')
+        return bytes_sent, http_status
+    peer = writer.get_extra_info('peername')
+    client_data = device.add_network_client(writer, f'{peer[0]}:{peer[1]} websocket', ROLE_OBSERVE)
+    receiver = asyncio.create_task(receive_websocket_commands(ws, device, client_data))
+    try:
+        client_data.full_state_pending = False
+        await ws.send(json.dumps({'s': device.device_data}).encode('utf-8'))
+        while client_data.connected:
+            delta = await next_device_delta(device, client_data)
+            if delta is not None:
+                await ws.send(json.dumps({'d': delta}).encode('utf-8'))
+            elif client_data.connected:
+                await ws.ping()
+            client_data.bytes_sent = ws.bytes_sent
+        await ws.close()
+    except OSError as ose:
+        logging.info(f'websocket client {client_data.client_name} disconnected: {ose}', 'main:api_ws_callback')
+    finally:
+        receiver.cancel()
+        device.remove_network_client(writer)
+    return ws.bytes_sent, HTTP_STATUS_SWITCHING_PROTOCOLS
+
+
+async def start_listener(name, callback, port) -> bool:
+    """
+    start the TCP service name on port, then close it on its old port.  port 0 just closes it.
+    if the new port cannot be opened the service stays on its old port, and False is returned.
+    closing the listening socket does not drop the clients it already accepted.
+    """
+    old_server, old_port = listeners.get(name, (None, 0))
+    if port == old_port:
+        return True
+    if port != 0:
+        logging.info(f'Starting {name} service on port {port}', 'main:start_listener')
+        try:
+            server = await asyncio.start_server(callback, '0.0.0.0', port)
+        except Exception as exc:
+            logging.exception(f'cannot start {name} service on port {port}', 'main:start_listener', exc_info=exc)
+            return False
+        listeners[name] = (server, port)
     else:
-        response = b'bad state parameter\r\n'
-        http_status = HTTP_STATUS_BAD_REQUEST
-    bytes_sent = await http.send_simple_response(writer, http_status, http.CT_TEXT_TEXT, response)
-    return bytes_sent, http_status
-
-
-@http_server.route(b'/api/kat_set_attn')
-async def api_kat_set_attn_callback(http, verb, args, reader, writer, request_headers=None):
-    state = args.get('state')
-    if state in ('0', '1'):
-        command = f'ATTN{state};ATTN;'.encode()
-        kat500.enqueue_command(command)
-        response = b'ok\r\n'
-        http_status = HTTP_STATUS_OK
+        listeners.pop(name, None)
+    if old_server is not None:
+        logging.info(f'Stopping {name} service on port {old_port}', 'main:start_listener')
+        old_server.close()
+    return True
+
+
+def start_status_publisher(device, device_name, address, port):
+    """
+    start UDP status for a device.  a bad address only disables the status, the device still runs.
+    """
+    logging.info(f'Starting {device_name} UDP status to {address}:{port}', 'main:start_status_publisher')
+    try:
+        device.status_publisher = StatusPublisher(device, device_name, address, port)
+    except Exception as exc:
+        logging.exception(f'cannot start {device_name} UDP status to {address}:{port}, disabled',
+                          'main:start_status_publisher', exc_info=exc)
+        return
+    asyncio.create_task(device.status_publisher.run())
+
+
+def client_policy():
+    """
+    network client policy, unauthenticated clients either observe or get nothing until they log in.
+    """
+    if config.get('unauthenticated_role') == ROLE_NAMES[ROLE_NONE]:
+        unauthenticated_role = ROLE_NONE
     else:
-        response = b'bad state parameter\r\n'
-        http_status = HTTP_STATUS_BAD_REQUEST
-    bytes_sent = await http.send_simple_response(writer, http_status, http.CT_TEXT_TEXT, response)
-    return bytes_sent, http_status
+        unauthenticated_role = ROLE_OBSERVE
+    return unauthenticated_role, config.get('observer_update_ms')
 
 
-@http_server.route(b'/api/kat_set_bypass')
-async def api_kat_set_bypass_callback(http, verb, args, reader, writer, request_headers=None):
-    state = args.get('state')
-    if state in ('0', '1'):
-        if state == '1':
-            command = b'BYPB;BYP;'
-        else:
-            command = b'BYPN;BYP;'
-        kat500.enqueue_command(command)
-        response = b'ok\r\n'
-        http_status = HTTP_STATUS_OK
+def apply_web_limits():
+    http_server.max_connections = config.get('web_max_connections')
+    if config.get('web_queue_policy') == 'reject':
+        http_server.queue_policy = QUEUE_REJECT
     else:
-        response = b'bad state parameter\r\n'
-        http_status = HTTP_STATUS_BAD_REQUEST
-    bytes_sent = await http.send_simple_response(writer, http_status, http.CT_TEXT_TEXT, response)
-    return bytes_sent, http_status
+        http_server.queue_policy = QUEUE_WAIT
+
+
+async def apply_config(changed):
+    """
+    configuration listener, applies changes without a restart where it can.
+    returns the names of the changed fields that need a restart: the network settings,
+    and anything that would start a device or status publisher that is not running,
+    and the names of the ports that could not be opened, those changes are refused.
+    """
+    devices = [device for device in (kpa500, kat500) if device is not None]
+    restart = []
+    rejected = []
+    for name in changed:
+        if name in ('username', 'password'):
+            for device in devices:
+                setattr(device, name, config.get(name))
+        elif name in ('unauthenticated_role', 'observer_update_ms'):
+            unauthenticated_role, observer_update_ms = client_policy()
+            for device in devices:
+                device.set_client_policy(unauthenticated_role, observer_update_ms)
+        elif name in ('web_max_connections', 'web_queue_policy'):
+            apply_web_limits()
+        elif name == 'web_port':
+            if not await start_listener('web', http_server.serve_http_client,
+                                        config.get('web_port') or DEFAULT_WEB_PORT):
+                rejected.append(name)
+        elif name == 'kpa_tcp_port' and kpa500 is not None:
+            if not await start_listener('KPA500 client', kpa500.serve_kpa500_remote_client, config.get(name)):
+                rejected.append(name)
+        elif name == 'kat_tcp_port' and kat500 is not None:
+            if not await start_listener('KAT500 client', kat500.serve_kat500_remote_client, config.get(name)):
+                rejected.append(name)
+        elif name in ('udp_status_address', 'udp_status_port') and config.get('udp_status_port') != 0:
+            publishers = [device.status_publisher for device in devices if device.status_publisher is not None]
+            if len(publishers) == 0:
+                restart.append(name)
+            for publisher in publishers:
+                try:
+                    publisher.set_destination(config.get('udp_status_address'), config.get('udp_status_port'))
+                except Exception as exc:
+                    logging.exception('cannot change UDP status destination', 'main:apply_config', exc_info=exc)
+                    restart.append(name)
+        else:
+            restart.append(name)
+    if restart:
+        logging.info(f'restart needed to apply {", ".join(restart)}', 'main:apply_config')
+    return restart, rejected
 
 
 async def main():
@@ -483,25 +698,14 @@ async def main():
 
     logging.info('Starting...', 'main:main')
 
-    config = read_config()
+    if ota.recover() and upython:
+        machine.reset()  # run the files the interrupted update put in place.
+
+    config.load()  # every field is checked against CONFIG_SCHEMA, bad ones get their defaults.
     username = config.get('username')
     password = config.get('password')
-
-    kpa500_tcp_port_s = config.get('kpa_tcp_port')
-    if kpa500_tcp_port_s is None:
-        kpa500_tcp_port_s = str(DEFAULT_KPA500_TCP_PORT)
-        config['kpa_tcp_port'] = kpa500_tcp_port_s
-    kat500_tcp_port_s = config.get('kat_tcp_port')
-    if kat500_tcp_port_s is None:
-        kat500_tcp_port_s = str(DEFAULT_KAT500_TCP_PORT)
-        config['kat_tcp_port'] = kat500_tcp_port_s
-
-    kpa500_tcp_port = safe_int(kpa500_tcp_port_s)
-    if kpa500_tcp_port < 0 or kpa500_tcp_port > 65535:
-        kpa500_tcp_port = DEFAULT_KPA500_TCP_PORT
-    kat500_tcp_port = safe_int(kat500_tcp_port_s)
-    if kat500_tcp_port < 0 or kat500_tcp_port > 65535:
-        kat500_tcp_port = DEFAULT_KAT500_TCP_PORT
+    kpa500_tcp_port = config.get('kpa_tcp_port')
+    kat500_tcp_port = config.get('kat_tcp_port')
 
     if upython:
         kat500_port = '1'
@@ -518,12 +722,13 @@ async def main():
             kpa500_port = None
             logging.error(f'Unsupported platform {sys.platform}')
 
-    web_port = safe_int(config.get('web_port') or DEFAULT_WEB_PORT, DEFAULT_WEB_PORT)
-    if web_port < 0 or web_port > 65535:
-        web_port = DEFAULT_WEB_PORT
-        config['web_port'] = str(web_port)
+    web_port = config.get('web_port') or DEFAULT_WEB_PORT
+    apply_web_limits()
+    unauthenticated_role, observer_update_ms = client_policy()
 
-    ap_mode = config.get('ap_mode', False)
+    # optional UDP status broadcast/multicast for passive listeners.
+    udp_status_address = config.get('udp_status_address')
+    udp_status_port = config.get('udp_status_port')
 
     if upython:
         picow_network = PicowNetwork(config, DEFAULT_SSID, DEFAULT_SECRET)
@@ -535,38 +740,41 @@ async def main():
         picow_network = None
         morse_code_sender = None
 
+    tasks = []  # the long running tasks, cancelled on the way out.
+
     # KPA500 specific
     if kpa500_tcp_port != 0:
         kpa500 = KPA500(username=username, password=password, port_name=kpa500_port)
-        logging.info(f'Starting KPA500 client service on port {kpa500_tcp_port}', 'main:main')
-        kpa500_client_server = asyncio.create_task(asyncio.start_server(kpa500.serve_kpa500_remote_client,
-                                                                        '0.0.0.0', kpa500_tcp_port))
+        kpa500.set_client_policy(unauthenticated_role, observer_update_ms)
+        if udp_status_port != 0:
+            start_status_publisher(kpa500, 'KPA500', udp_status_address, udp_status_port)
+        await start_listener('KPA500 client', kpa500.serve_kpa500_remote_client, kpa500_tcp_port)
         # this task talks to the amplifier hardware.
         logging.info(f'Starting KPA500 amplifier service', 'main:main')
-        kpa500_server = asyncio.create_task(kpa500.kpa500_server())
+        tasks.append(asyncio.create_task(kpa500.kpa500_server()))
     else:
         kpa500 = None
-        kpa500_server = None
 
     # KAT500 specific
     if kat500_tcp_port != 0:
         kat500 = KAT500(username=username, password=password, port_name=kat500_port)
-        logging.info(f'Starting KAT500 client service on port {kat500_tcp_port}', 'main:main')
-        kat500_client_server = asyncio.create_task(asyncio.start_server(kat500.serve_kat500_remote_client,
-                                                                        '0.0.0.0', kat500_tcp_port))
+        kat500.set_client_policy(unauthenticated_role, observer_update_ms)
+        if udp_status_port != 0:
+            start_status_publisher(kat500, 'KAT500', udp_status_address, udp_status_port)
+        await start_listener('KAT500 client', kat500.serve_kat500_remote_client, kat500_tcp_port)
         # this task talks to the tuner hardware.
         logging.info(f'Starting KAT500 tuner service', 'main:main')
-        kat500_server = asyncio.create_task(kat500.kat500_server())
+        tasks.append(asyncio.create_task(kat500.kat500_server()))
     else:
         kat500 = None
-        kat500_client_server = None
-        kat500_server = None
 
-    logging.info(f'Starting web service on port {web_port}', 'main:main')
-    try:
-        web_server = asyncio.create_task(asyncio.start_server(http_server.serve_http_client, '0.0.0.0', web_port))
-    except Exception as e:
-        logging.error(e)
+    # one shared timer sends keepalives to all the KPA500 & KAT500 network clients.
+    tasks.append(asyncio.create_task(keepalive_timer.run()))
+    # and one task decides when to collect garbage.
+    tasks.append(asyncio.create_task(gc_manager.run()))
+
+    await start_listener('web', http_server.serve_http_client, web_port)
+    config.add_listener(apply_config)  # from now on, most changes take effect at once.
 
     reset_button_pressed_count = 0
     four_count = 0
@@ -583,9 +791,7 @@ async def main():
                     reset_button_pressed_count -= 1
             if reset_button_pressed_count > 7:
                 logging.info('reset button pressed', 'main:main')
-                ap_mode = not ap_mode
-                config['ap_mode'] = ap_mode
-                save_config(config)
+                await config.update({'ap_mode': not config.get('ap_mode')})
                 keep_running = False
             if four_count >= 4:  # check for new message every one second
                 msg = picow_network.get_message()
@@ -595,6 +801,9 @@ async def main():
                 four_count = 0
         else:
             await asyncio.sleep(10.0)
+    for task in tasks:
+        task.cancel()
+    config.flush()  # do not lose a change that is waiting to be written.
     if upython:
         machine.soft_reset()
 
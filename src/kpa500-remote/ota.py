@@ -0,0 +1,345 @@
+#
+# ota.py -- apply a bundle of application files sent over HTTP.
+#
+__author__ = 'J. B. Otterson'
+__copyright__ = """
+Copyright 2026 J. B. Otterson N1KDO.
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+  1. Redistributions of source code must retain the above copyright notice,
+     this list of conditions and the following disclaimer.
+  2. Redistributions in binary form must reproduce the above copyright notice,
+     this list of conditions and the following disclaimer in the documentation
+     and/or other materials provided with the distribution.
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
+OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+__version__ = '0.0.4'  # 2026-10-19
+
+# disable pylint import error
+# pylint: disable=E0401
+
+import asyncio
+import binascii
+import hashlib
+import json
+import os
+import micro_logging as logging
+
+from http_server import (HTTP_STATUS_BAD_REQUEST, HTTP_STATUS_INSUFFICIENT_STORAGE,
+                         file_size_mtime, remove_gzip_sibling)
+from utils import upython
+if not upython:
+    def const(i):
+        return i
+
+#
+# a bundle is a ustar archive.  the first member is manifest.json:
+#   {"files": [{"path": "main.py", "size": 1234, "sha1": "<hex digest>"}, ...]}
+# the other members are files listed in the manifest.  a file whose size and hash already match
+# the copy on the device does not have to be in the archive, and is skipped if it is.
+# changed files are written to <path>.new and checked against the manifest, then a journal of
+# them is written and each is renamed over its old copy.  if power fails during the renames,
+# recover() finishes them from the journal at the next boot.
+#
+MANIFEST_NAME = 'manifest.json'
+JOURNAL_FILE = 'data/ota_journal.json'
+STAGE_SUFFIX = '.new'
+PROTECTED_PREFIX = 'data/'  # configuration lives here, a bundle never replaces it.
+
+_BLOCK_SIZE = const(512)
+_MAX_MANIFEST_SIZE = const(4096)
+_MAX_PATH_LENGTH = const(64)
+_S_IFDIR = const(0x4000)
+
+
+class BundleError(Exception):
+    def __init__(self, message, http_status=HTTP_STATUS_BAD_REQUEST):
+        super().__init__(message)
+        self.message = message
+        self.http_status = http_status
+
+
+def valid_path(path) -> bool:
+    """
+    bundle paths are relative, stay below the application directory, and never touch data/.
+    """
+    if not isinstance(path, str) or not 0 < len(path) <= _MAX_PATH_LENGTH:
+        return False
+    if path.startswith('/') or path.startswith(PROTECTED_PREFIX) or path.endswith(STAGE_SUFFIX):
+        return False
+    for part in path.split('/'):
+        if part in ('', '.', '..'):
+            return False
+    return True
+
+
+def _exists(path) -> bool:
+    try:
+        os.stat(path)
+        return True
+    except OSError:
+        return False
+
+
+def _make_parent_dirs(path):
+    pieces = path.split('/')[:-1]
+    directory = ''
+    for piece in pieces:
+        directory += piece
+        if not _exists(directory):
+            os.mkdir(directory)
+        directory += '/'
+
+
+def _free_bytes() -> int:
+    statvfs = getattr(os, 'statvfs', None)
+    if statvfs is None:
+        return -1
+    stat = statvfs('/')
+    return stat[0] * stat[4]
+
+
+def _write_journal(paths):
+    _make_parent_dirs(JOURNAL_FILE)
+    temp_name = JOURNAL_FILE + '.tmp'
+    with open(temp_name, 'w', encoding='utf-8') as journal:
+        json.dump(paths, journal)
+    os.rename(temp_name, JOURNAL_FILE)
+
+
+def _apply_staged(paths, http=None, keep_gzip=()):
+    for path in paths:
+        staged = path + STAGE_SUFFIX
+        if _exists(staged):
+            os.rename(staged, path)
+        if http is not None:
+            http.invalidate_content(path)
+            if path + '.gz' not in keep_gzip:
+                remove_gzip_sibling(http, path)
+
+
+def recover() -> bool:
+    """
+    finish a bundle commit that was interrupted.  returns True if files were replaced,
+    then the device should restart to run them.
+    """
+    if not _exists(JOURNAL_FILE):
+        return False
+    paths = []
+    try:
+        with open(JOURNAL_FILE, 'r', encoding='utf-8') as journal:
+            paths = json.load(journal)
+        logging.warning(f'finishing interrupted update of {len(paths)} files', 'ota:recover')
+        _apply_staged(paths)
+    except Exception as exc:
+        logging.exception('cannot finish interrupted update', 'ota:recover', exc_info=exc)
+    try:
+        os.remove(JOURNAL_FILE)
+    except OSError:
+        pass
+    return len(paths) > 0
+
+
+async def inventory(http, directory='') -> list:
+    """
+    return [{'path', 'size', 'sha1'}, ...] for every file below directory that a bundle could replace.
+    hashes come from the server's file hash cache, so only files that changed since they were last
+    hashed are read.  yields to other tasks after each file is hashed.
+    """
+    files = []
+    for name in os.listdir(directory) if directory else os.listdir():
+        path = directory + name
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if stat[0] & _S_IFDIR:
+            if path + '/' != PROTECTED_PREFIX:
+                files.extend(await inventory(http, path + '/'))
+            continue
+        if not valid_path(path):
+            continue
+        size, mtime = file_size_mtime(path)
+        if size < 0:
+            continue
+        files.append({'path': path, 'size': size, 'sha1': http.file_hash(path, size, mtime)})
+        await asyncio.sleep(0)
+    return files
+
+
+def _parse_manifest(data) -> dict:
+    """
+    return path -> (size, sha1 hex digest) for a manifest, or raise BundleError.
+    """
+    try:
+        manifest = json.loads(data)
+        files = manifest['files']
+        entries = {}
+        for item in files:
+            path = item['path']
+            size = item['size']
+            sha1 = item['sha1']
+            if not valid_path(path) or not isinstance(size, int) or size < 0 or len(sha1) != 40:
+                raise BundleError(f'bad manifest entry for {path}')
+            entries[path] = (size, sha1.lower())
+    except BundleError:
+        raise
+    except Exception as exc:
+        raise BundleError(f'bad manifest: {exc}') from exc
+    return entries
+
+
+class _BundleReader:
+    """
+    reads exactly the request body, in blocks, into the server's buffer.
+    """
+    def __init__(self, reader, mv, content_length):
+        self._reader = reader
+        self._mv = mv
+        self.remaining = content_length
+
+    async def read(self, count: int):
+        """
+        read count bytes into the front of the buffer, count must fit in it.
+        """
+        if count > self.remaining:
+            raise BundleError('bundle is truncated')
+        got = 0
+        while got < count:
+            n = await self._reader.readinto(self._mv[got:count])
+            if n == 0:
+                raise BundleError('bundle is truncated')
+            got += n
+        self.remaining -= count
+
+    async def skip(self, count: int):
+        chunk = len(self._mv)
+        while count > 0:
+            n = chunk if count > chunk else count
+            await self.read(n)
+            count -= n
+
+
+def _tar_header(mv):
+    """
+    return (name, size, type flag) from a tar header block, or None for an end of archive block.
+    """
+    if mv[0] == 0:
+        return None
+    name = bytes(mv[0:100])
+    end = name.find(b'\0')
+    if end >= 0:
+        name = name[:end]
+    if bytes(mv[257:262]) == b'ustar':
+        prefix = bytes(mv[345:500])
+        end = prefix.find(b'\0')
+        if end >= 0:
+            prefix = prefix[:end]
+        if len(prefix) > 0:
+            name = prefix + b'/' + name
+    size_field = bytes(mv[124:136]).strip(b'\0 ')
+    try:
+        size = int(size_field.decode(), 8) if len(size_field) > 0 else 0
+    except ValueError as exc:
+        raise BundleError('bad tar header') from exc
+    return name.decode(), size, mv[156]
+
+
+async def receive_bundle(http, reader, content_length: int):
+    """
+    read a bundle from the request body and apply it.  returns a dict describing what was done,
+    or raises BundleError.  the caller must hold http.buffer_lock, the bundle is read into http.buffer.
+    """
+    mv = http.bmv
+    bundle = _BundleReader(reader, mv, content_length)
+    await bundle.read(_BLOCK_SIZE)
+    header = _tar_header(mv)
+    if header is None or header[0] != MANIFEST_NAME:
+        raise BundleError(f'the first bundle member must be {MANIFEST_NAME}')
+    size = header[1]
+    if size > _MAX_MANIFEST_SIZE or size > len(mv):
+        raise BundleError('manifest is too big')
+    padded = (size + _BLOCK_SIZE - 1) & ~(_BLOCK_SIZE - 1)
+    await bundle.read(padded)
+    entries = _parse_manifest(bytes(mv[:size]))
+
+    # decide what has to change before any data arrives.
+    changed = {}
+    unchanged = 0
+    for path, (size, sha1) in entries.items():
+        device_size, mtime = file_size_mtime(path)
+        if device_size == size and http.file_hash(path, device_size, mtime) == sha1:
+            unchanged += 1
+        else:
+            changed[path] = (size, sha1)
+    needed = 0
+    for size, sha1 in changed.values():
+        needed += size + _BLOCK_SIZE
+    free = _free_bytes()
+    if 0 <= free < needed:
+        raise BundleError(f'need {needed} bytes to stage the update, {free} are free', HTTP_STATUS_INSUFFICIENT_STORAGE)
+
+    staged = []
+    try:
+        while True:
+            await bundle.read(_BLOCK_SIZE)
+            header = _tar_header(mv)
+            if header is None:
+                break
+            path, size, type_flag = header
+            padded = (size + _BLOCK_SIZE - 1) & ~(_BLOCK_SIZE - 1)
+            entry = changed.get(path)
+            if type_flag not in (0x30, 0) or entry is None:  # '0' or NUL is a regular file
+                if type_flag in (0x30, 0) and path not in entries:
+                    raise BundleError(f'{path} is not in the manifest')
+                await bundle.skip(padded)  # a directory, or a file that is already up to date
+                continue
+            if size != entry[0]:
+                raise BundleError(f'{path} is {size} bytes, the manifest says {entry[0]}')
+            if path in staged:
+                raise BundleError(f'{path} is in the bundle twice')
+            _make_parent_dirs(path)
+            sha1 = hashlib.sha1()
+            chunk = len(mv)
+            staged.append(path)
+            with open(path + STAGE_SUFFIX, 'wb') as staged_file:
+                left = size
+                while left > 0:
+                    n = chunk if left > chunk else left
+                    await bundle.read(n)
+                    sha1.update(mv[:n])
+                    staged_file.write(mv[:n])
+                    left -= n
+            await bundle.skip(padded - size)
+            if binascii.hexlify(sha1.digest()).decode() != entry[1]:
+                raise BundleError(f'{path} does not match its sha1')
+        for path in changed:
+            if path not in staged:
+                raise BundleError(f'{path} changed but is not in the bundle')
+    except BaseException:  # a bad bundle, a stalled read, or the request being cancelled.
+        for path in staged:
+            try:
+                os.remove(path + STAGE_SUFFIX)
+            except OSError:
+                pass
+        raise
+
+    if len(staged) > 0:
+        _write_journal(staged)
+        _apply_staged(staged, http, entries)
+        os.remove(JOURNAL_FILE)
+    logging.info(f'bundle applied, {len(staged)} files written, {unchanged} unchanged', 'ota:receive_bundle')
+    restart = False
+    for path in staged:
+        if path.endswith('.py'):
+            restart = True
+    return {'written': staged, 'unchanged': unchanged, 'restart': restart}
@@ -0,0 +1,125 @@
+#
+# status_publisher.py -- publish device status changes as UDP broadcast or multicast datagrams.
+#
+__author__ = 'J. B. Otterson'
+__copyright__ = """
+Copyright 2026 J. B. Otterson N1KDO.
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+  1. Redistributions of source code must retain the above copyright notice,
+     this list of conditions and the following disclaimer.
+  2. Redistributions in binary form must reproduce the above copyright notice,
+     this list of conditions and the following disclaimer in the documentation
+     and/or other materials provided with the distribution.
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
+OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+__version__ = '0.0.4'  # 2026-10-19
+
+# disable pylint import error
+# pylint: disable=E0401
+
+import asyncio
+import socket
+import micro_logging as logging
+from utils import milliseconds, safe_int, ticks_add, ticks_diff
+
+#
+# datagram format, all text, one item per line:
+#   <device name> <D|F> <sequence number>\n
+#   <index>=<value>\n
+#   ...
+# D datagrams carry only the items that changed, F datagrams carry every item.
+# the sequence number increments for every datagram, so a listener that sees a gap
+# should wait for the next F datagram before trusting its copy of the state.
+#
+DELTA = b'D'
+FULL = b'F'
+
+
+class StatusPublisher:
+    """
+    publishes device_data changes for any number of passive listeners.
+    changes are batched every interval_ms, and a full snapshot is sent every snapshot_ms,
+    so the cost is the same no matter how many listeners there are.
+    """
+    def __init__(self, device, device_name: str, address: str, port: int,
+                 interval_ms: int = 100, snapshot_ms: int = 5000, ttl: int = 1):
+        self._device = device
+        self._device_name = device_name.encode()
+        self._interval_ms = interval_ms
+        self._snapshot_ms = snapshot_ms
+        self._changed = set()
+        self.sequence = 0
+        self.datagrams_sent = 0
+        self.send_errors = 0
+        self._ttl = ttl
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+        try:
+            self.set_destination(address, port)
+        except Exception:
+            self._socket.close()
+            raise
+
+    def set_destination(self, address: str, port: int):
+        """
+        send to a new address and port from the next datagram on.
+        an address that cannot be resolved raises, and the old destination is kept.
+        """
+        destination = socket.getaddrinfo(address, port)[0][-1]
+        first_octet = safe_int(address.split('.')[0])
+        self._destination = destination
+        ttl = self._ttl
+        try:
+            if 224 <= first_octet <= 239:
+                ip_multicast_ttl = getattr(socket, 'IP_MULTICAST_TTL', None)
+                if ip_multicast_ttl is not None:
+                    self._socket.setsockopt(socket.IPPROTO_IP, ip_multicast_ttl, ttl)
+            else:
+                so_broadcast = getattr(socket, 'SO_BROADCAST', None)
+                if so_broadcast is not None:
+                    self._socket.setsockopt(socket.SOL_SOCKET, so_broadcast, 1)
+        except OSError as ose:
+            logging.warning(f'cannot set socket options for {address}: {ose}', 'status_publisher:set_destination')
+
+    def field_changed(self, index: int):
+        self._changed.add(index)
+
+    def _send(self, kind: bytes, indexes):
+        self.sequence += 1
+        device_data = self._device.device_data
+        parts = [b'%s %s %d\n' % (self._device_name, kind, self.sequence)]
+        for index in indexes:
+            parts.append(b'%d=%s\n' % (index, device_data[index].encode()))
+        try:
+            self._socket.sendto(b''.join(parts), self._destination)
+            self.datagrams_sent += 1
+        except OSError as ose:
+            self.send_errors += 1
+            if logging.should_log(logging.DEBUG):
+                logging.debug(f'sendto failed: {ose}', 'status_publisher:_send')
+
+    async def run(self):
+        interval = self._interval_ms / 1000.0
+        last_snapshot = ticks_add(milliseconds(), -self._snapshot_ms)
+        changed = self._changed
+        while True:
+            now = milliseconds()
+            if ticks_diff(now, last_snapshot) >= self._snapshot_ms:
+                changed.clear()
+                self._send(FULL, range(len(self._device.device_data)))
+                last_snapshot = now
+            elif len(changed) > 0:
+                indexes = sorted(changed)
+                changed.clear()
+                self._send(DELTA, indexes)
+            await asyncio.sleep(interval)
@@ -0,0 +1,86 @@
+#
+# timing_wheel.py -- one shared timer for many idle timeouts.
+#
+__author__ = 'J. B. Otterson'
+__copyright__ = """
+Copyright 2026 J. B. Otterson N1KDO.
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+  1. Redistributions of source code must retain the above copyright notice,
+     this list of conditions and the following disclaimer.
+  2. Redistributions in binary form must reproduce the above copyright notice,
+     this list of conditions and the following disclaimer in the documentation
+     and/or other materials provided with the distribution.
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
+OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+__version__ = '0.0.2'  # 2026-10-19
+
+import asyncio
+from utils import milliseconds, ticks_add, ticks_diff
+
+
+class TimingWheel:
+    """
+    a hashed timing wheel that calls callback(entry) when an entry has been idle for interval_ms.
+    entries must have a last_activity attribute (milliseconds).
+    each tick only looks at the entries filed in the current slot.  activity does not touch the
+    wheel at all: when an entry's slot comes around, it is re-filed by its latest deadline.
+    """
+    def __init__(self, interval_ms: int, callback, slot_ms: int = 1000):
+        self._interval_ms = interval_ms
+        self._callback = callback
+        self._slot_ms = slot_ms
+        self._num_slots = interval_ms // slot_ms + 2
+        self._slots = [set() for _ in range(self._num_slots)]
+        self._entry_slots = {}
+        self._current = 0
+
+    def _file(self, entry, deadline: int, now: int):
+        offset = (ticks_diff(deadline, now) + self._slot_ms - 1) // self._slot_ms
+        if offset < 1:
+            offset = 1
+        elif offset >= self._num_slots:
+            offset = self._num_slots - 1
+        slot = (self._current + offset) % self._num_slots
+        self._slots[slot].add(entry)
+        self._entry_slots[entry] = slot
+
+    def add(self, entry):
+        self._file(entry, ticks_add(entry.last_activity, self._interval_ms), milliseconds())
+
+    def remove(self, entry):
+        slot = self._entry_slots.pop(entry, None)
+        if slot is not None:
+            self._slots[slot].discard(entry)
+
+    def __len__(self):
+        return len(self._entry_slots)
+
+    def tick(self, now: int):
+        self._current = (self._current + 1) % self._num_slots
+        bucket = self._slots[self._current]
+        if len(bucket) == 0:
+            return
+        self._slots[self._current] = set()
+        interval_ms = self._interval_ms
+        for entry in bucket:
+            deadline = ticks_add(entry.last_activity, interval_ms)
+            if ticks_diff(deadline, now) <= 0:
+                self._callback(entry)
+                deadline = ticks_add(now, interval_ms)
+            self._file(entry, deadline, now)
+
+    async def run(self):
+        period = self._slot_ms / 1000.0
+        while True:
+            await asyncio.sleep(period)
+            self.tick(milliseconds())
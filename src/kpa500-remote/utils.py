@@ -22,7 +22,7 @@ LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
 OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
 OF THE POSSIBILITY OF SUCH DAMAGE.
 """
-__version__ = '0.9.5'  # 2026-05-29
+__version__ = '0.9.6'  # 2026-10-19
 
 import sys
 import time
@@ -61,6 +61,15 @@ def milliseconds():
     return time.ticks_ms() if upython else int(time.time() * 1000)
 
 
+# ticks_ms() wraps, so deadlines and elapsed times must be worked out with these, not + and -.
+def ticks_add(ticks: int, delta: int) -> int:
+    return time.ticks_add(ticks, delta) if upython else ticks + delta
+
+
+def ticks_diff(end: int, start: int) -> int:
+    return time.ticks_diff(end, start) if upython else end - start
+
+
 @micropython.native
 def safe_int(value, default:int=-1) -> int:
     if value is None:
@@ -0,0 +1,148 @@
+#
+# websocket.py -- minimal RFC 6455 WebSocket framing for the http server.
+#
+__author__ = 'J. B. Otterson'
+__copyright__ = """
+Copyright 2026 J. B. Otterson N1KDO.
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+  1. Redistributions of source code must retain the above copyright notice,
+     this list of conditions and the following disclaimer.
+  2. Redistributions in binary form must reproduce the above copyright notice,
+     this list of conditions and the following disclaimer in the documentation
+     and/or other materials provided with the distribution.
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
+OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+__version__ = '0.0.1'  # 2026-10-19
+
+# disable pylint import error
+# pylint: disable=E0401
+
+import binascii
+import hashlib
+
+from utils import upython
+if not upython:
+    def const(i):
+        return i
+
+OP_CONTINUATION = const(0x0)
+OP_TEXT = const(0x1)
+OP_BINARY = const(0x2)
+OP_CLOSE = const(0x8)
+OP_PING = const(0x9)
+OP_PONG = const(0xa)
+
+CLOSE_NORMAL = const(1000)
+CLOSE_PROTOCOL_ERROR = const(1002)
+CLOSE_TOO_BIG = const(1009)
+
+_MAX_MESSAGE_SIZE = const(1024)  # messages from the browser are small commands.
+_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+def accept_key(key: bytes) -> bytes:
+    """
+    compute the Sec-WebSocket-Accept value for a client's Sec-WebSocket-Key.
+    """
+    return binascii.b2a_base64(hashlib.sha1(key + _GUID).digest())[:-1]  # strip the newline
+
+
+class WebSocket:
+    """
+    one server side WebSocket connection.  the server never masks, the client always does.
+    each frame is written without an await between its header and payload, so frames sent
+    by different tasks on the same socket never interleave.
+    """
+    def __init__(self, reader, writer, max_message_size: int = _MAX_MESSAGE_SIZE):
+        self._reader = reader
+        self._writer = writer
+        self._max_message_size = max_message_size
+        self.closed = False
+        self.bytes_sent = 0
+
+    def _write_frame(self, opcode: int, payload):
+        length = len(payload)
+        if length < 126:
+            header = bytes((0x80 | opcode, length))
+        elif length < 65536:
+            header = bytes((0x80 | opcode, 126, length >> 8, length & 0xff))
+        else:
+            header = bytes((0x80 | opcode, 127)) + length.to_bytes(8, 'big')
+        self._writer.write(header)
+        if length > 0:
+            self._writer.write(payload)
+        self.bytes_sent += len(header) + length
+
+    async def send(self, message: bytes, opcode: int = OP_TEXT):
+        if self.closed:
+            return
+        self._write_frame(opcode, message)
+        await self._writer.drain()
+
+    async def ping(self):
+        await self.send(b'', OP_PING)
+
+    async def close(self, code: int = CLOSE_NORMAL):
+        if self.closed:
+            return
+        self._write_frame(OP_CLOSE, bytes((code >> 8, code & 0xff)))
+        self.closed = True
+        await self._writer.drain()
+
+    async def receive(self):
+        """
+        return the next text or binary message as bytes, or None when the connection is closed.
+        control frames are handled here.  raises EOFError or OSError if the socket is lost.
+        """
+        reader = self._reader
+        message = None
+        while True:
+            header = await reader.readexactly(2)
+            fin = header[0] & 0x80
+            opcode = header[0] & 0x0f
+            length = header[1] & 0x7f
+            if length == 126:
+                length = int.from_bytes(await reader.readexactly(2), 'big')
+            elif length == 127:
+                length = int.from_bytes(await reader.readexactly(8), 'big')
+            if not header[1] & 0x80:  # clients must mask every frame
+                await self.close(CLOSE_PROTOCOL_ERROR)
+                return None
+            if length > self._max_message_size or (message is not None and len(message) + length > self._max_message_size):
+                await self.close(CLOSE_TOO_BIG)
+                return None
+            mask = await reader.readexactly(4)
+            payload = bytearray(await reader.readexactly(length)) if length > 0 else bytearray()
+            for i in range(length):
+                payload[i] ^= mask[i & 3]
+
+            if opcode == OP_PING:
+                if not self.closed:
+                    self._write_frame(OP_PONG, payload)
+                    await self._writer.drain()
+            elif opcode == OP_PONG:
+                pass
+            elif opcode == OP_CLOSE:
+                await self.close()
+                return None
+            elif opcode in (OP_TEXT, OP_BINARY) and message is None:
+                if fin:
+                    return bytes(payload)
+                message = payload
+            elif opcode == OP_CONTINUATION and message is not None:
+                message.extend(payload)
+                if fin:
+                    return bytes(message)
+            else:
+                await self.close(CLOSE_PROTOCOL_ERROR)
+                return None
@@ -20,7 +20,7 @@ LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
 OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
 OF THE POSSIBILITY OF SUCH DAMAGE.
 """
-__version__ = '0.10.8'  # 2026-04-27
+__version__ = '0.10.11'  # 2026-10-19
 
 """
 Note: to edit linux forced device names, edit
@@ -29,11 +29,17 @@ see: https://programmador.com/posts/2023/linux-usb-serial-device-name-binding/
 see: https://k4sbc.com/consistently-name-usb-serial-ports/
 """
 import argparse
+import base64
+import gzip
 import hashlib
+import io
 import json
 import os
 import sys
+import tarfile
 import time
+import urllib.error
+import urllib.request
 
 # need pyserial to enumerate com ports.
 from serial.tools.list_ports import comports
@@ -172,20 +178,148 @@ def local_sha1(file):
     return bytes.hex(hasher.digest())
 
 
-def load_device(port, force=False,
-                manifest_filename='loader_manifest.json',
-                no_watchdog=False,
-                bootloader=False):
+def gzip_file(source_file_name, gzip_file_name):
+    """
+    write a gzip copy of a file.  the header has no name and no timestamp,
+    so the copy only changes when the source does, and unchanged files are not sent again.
+    """
+    with open(source_file_name, 'rb') as fp:
+        data = fp.read()
+    with open(gzip_file_name, 'wb') as fp:
+        with gzip.GzipFile(filename='', mode='wb', fileobj=fp, compresslevel=9, mtime=0) as gz:
+            gz.write(data)
+
+
+def build_compressed_files(files_list, source_directory, build_directory, compress_extensions):
+    """
+    make name.gz copies of the files with the listed extensions, for the web server to send to
+    browsers that accept gzip.  returns a dict of target file name -> local gzip file name.
+    """
+    compressed_files = {}
+    for file in files_list:
+        if file.endswith('/') or not file.endswith(compress_extensions):
+            continue
+        source_file_name = source_directory + file
+        gzip_file_name = build_directory + file + '.gz'
+        os.makedirs(os.path.dirname(gzip_file_name), exist_ok=True)
+        gzip_file(source_file_name, gzip_file_name)
+        source_size = os.stat(source_file_name).st_size
+        gzip_size = os.stat(gzip_file_name).st_size
+        if gzip_size >= source_size:
+            os.remove(gzip_file_name)
+            continue
+        print(f'compressed {file} {source_size} -> {gzip_size} bytes')
+        compressed_files[file + '.gz'] = gzip_file_name
+    return compressed_files
+
+
+def read_manifest(manifest_filename):
+    """
+    return (files_list, special_files_list, source_directory, compress_extensions, build_directory).
+    """
     try:
         with open(manifest_filename, 'r') as manifest_file:
             manifest = json.load(manifest_file)
-            files_list = manifest.get('files', [])
-            special_files_list = manifest.get('special_files', [])
-            source_directory = manifest.get('source_directory', '.')
+            return (manifest.get('files', []),
+                    manifest.get('special_files', []),
+                    manifest.get('source_directory', '.'),
+                    tuple(manifest.get('compress_extensions', [])),
+                    manifest.get('build_directory', 'build/'))
     except FileNotFoundError:
         print(f'cannot open manifest file {manifest_filename}.')
         sys.exit(1)
 
+
+def fetch_inventory(host):
+    """
+    return {path: (size, sha1)} for the application files on a device, from /api/inventory.
+    """
+    try:
+        with urllib.request.urlopen(f'http://{host}/api/inventory', timeout=60) as response:
+            return {item['path']: (item['size'], item['sha1']) for item in json.loads(response.read())}
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        print(f'cannot get inventory from {host}: {e}')
+        return None
+
+
+def build_bundle(manifest_filename='loader_manifest.json', no_watchdog=False, inventory=None):
+    """
+    make an update bundle for /api/ota_bundle: a tar archive of manifest.json, with the size and sha1
+    of every file, followed by the files.  special files (the configuration) are never in a bundle.
+    files that match the device inventory are listed in the manifest but left out of the archive.
+    """
+    files_list, special_files_list, source_directory, compress_extensions, build_directory = \
+        read_manifest(manifest_filename)
+    compressed_files = build_compressed_files(files_list, source_directory, build_directory, compress_extensions)
+    members = []  # (target file name, local file name)
+    for file in files_list + list(compressed_files):
+        if file.endswith('/') or file in special_files_list:
+            continue
+        if no_watchdog and file.endswith(_WATCHDOG_PY):
+            print(f'Skipping {file}')
+            continue
+        members.append((file, compressed_files.get(file) or source_directory + file))
+
+    manifest = {'files': [{'path': file, 'size': os.stat(local_file).st_size, 'sha1': local_sha1(local_file)}
+                          for file, local_file in members]}
+    if inventory is not None:
+        changed = []
+        for item, member in zip(manifest['files'], members):
+            if inventory.get(item['path']) != (item['size'], item['sha1']):
+                changed.append(member)
+        print(f'{len(members) - len(changed)} files already on the device.')
+        members = changed
+    manifest_data = json.dumps(manifest).encode()
+    bundle = io.BytesIO()
+    with tarfile.open(fileobj=bundle, mode='w', format=tarfile.USTAR_FORMAT) as tar:
+        info = tarfile.TarInfo(name='manifest.json')
+        info.size = len(manifest_data)
+        tar.addfile(info, io.BytesIO(manifest_data))
+        for file, local_file in members:
+            info = tarfile.TarInfo(name=file)
+            info.size = os.stat(local_file).st_size
+            with open(local_file, 'rb') as fp:
+                tar.addfile(info, fp)
+    return bundle.getvalue()
+
+
+def send_bundle(host, bundle, username, password, restart=False):
+    """
+    post a bundle to a device's web server.  the device only writes the files that differ from its copies.
+    """
+    url = f'http://{host}/api/ota_bundle' + ('?restart=1' if restart else '')
+    credentials = base64.b64encode(f'{username}:{password}'.encode()).decode()
+    request = urllib.request.Request(url, data=bundle, method='POST',
+                                     headers={'Content-Type': 'application/x-tar',
+                                              'Authorization': f'Basic {credentials}'})
+    print(f'sending {len(bundle)} byte bundle to {host}...')
+    try:
+        with urllib.request.urlopen(request, timeout=120) as response:
+            result = json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        print(f'update failed: {e.code} {e.read().decode().strip()}')
+        return False
+    except (urllib.error.URLError, OSError) as e:
+        print(f'cannot reach {host}: {e}')
+        return False
+    for file in result.get('written', []):
+        print(f'updated {file}')
+    print(f'{result.get("unchanged", 0)} files unchanged.')
+    if result.get('restart'):
+        print('Device is restarting.' if restart else 'Restart the device to run the new code.')
+    return True
+
+
+def load_device(port, force=False,
+                manifest_filename='loader_manifest.json',
+                no_watchdog=False,
+                bootloader=False):
+    files_list, special_files_list, source_directory, compress_extensions, build_directory = \
+        read_manifest(manifest_filename)
+
+    compressed_files = build_compressed_files(files_list, source_directory, build_directory, compress_extensions)
+    files_list = files_list + list(compressed_files)
+
     try:
         target = Pyboard(port, _BAUD_RATE)
     except PyboardError:
@@ -261,12 +395,17 @@ def load_device(port, force=False,
             # if this is not a directory, get the sha1 hash of the pico-w file
             # and compare it with the sha1 hash of the local file.
             # do not send unchanged files.  This makes subsequent loader invocations much faster.
+            compressed_file = compressed_files.get(file)
+            if compressed_file is not None:
+                local_directory, local_file = '', compressed_file
+            else:
+                local_directory, local_file = source_directory, file
             if file in existing_files:
                 picow_hash = loader_sha1(target, file)
-                local_hash = local_sha1(source_directory + file)
+                local_hash = local_sha1(local_directory + local_file)
                 if picow_hash == local_hash:
                     continue
-            put_file(file, target, source_directory=source_directory)
+            put_file(file, target, source_directory=local_directory, src_file_name=local_file)
         else:
             if file not in existing_files:
                 put_file(file, target, source_directory=source_directory)
@@ -313,7 +452,33 @@ def main():
     parser.add_argument('--manifest-filename',
                         help='name of manifest file',
                         default='loader_manifest.json')
+    parser.add_argument('--bundle',
+                        help='write an update bundle to this file instead of loading a device.')
+    parser.add_argument('--host',
+                        help='update this device over the network instead of USB.')
+    parser.add_argument('--username',
+                        help='device username for --host.',
+                        default='admin')
+    parser.add_argument('--password',
+                        help='device password for --host.',
+                        default='admin')
+    parser.add_argument('--restart',
+                        action='store_true',
+                        help='restart the device after a --host update that changed code.')
     args = parser.parse_args()
+
+    if args.bundle is not None or args.host is not None:
+        inventory = None
+        if args.host is not None and not args.force:
+            inventory = fetch_inventory(args.host)
+        bundle = build_bundle(args.manifest_filename, args.no_watchdog, inventory)
+        if args.bundle is not None:
+            with open(args.bundle, 'wb') as bundle_file:
+                bundle_file.write(bundle)
+            print(f'wrote {len(bundle)} byte bundle to {args.bundle}')
+        if args.host is not None and not send_bundle(args.host, bundle, args.username, args.password, args.restart):
+            sys.exit(1)
+        return
     bootloader = args.bootloader
     force = args.force
     no_watchdog = args.no_watchdog